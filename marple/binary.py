@@ -0,0 +1,165 @@
+# encoding: utf-8
+""" A binary file format for datasets, for fast reloading.
+
+    A file starts with a magic string and the length of a json header,
+    followed by the header and the raw arrays of the cube:
+
+        MARPLEDS | header length (uint64) | header (json) | arrays
+
+    The header holds the json stat metadata (everything but value and
+    status), the status categories and the dtype, offset and length of every
+    array. Arrays are aligned to `ALIGNMENT` bytes. String values can't be
+    stored as raw arrays and are kept in the header.
+"""
+import io
+import json
+import os
+import struct
+import uuid
+import numpy as np
+from marple.cube import Cube, SparseCube, to_value_list
+
+MAGIC = b"MARPLEDS"
+
+VERSION = 1
+
+ALIGNMENT = 64
+
+
+def write_binary(file_path, json_data, cube):
+    """ Write a dataset to a binary file. The file is written next to the
+        target and then moved in place, so an existing file that is memory
+        mapped (e.g. by `read_binary`, here or in another process) is
+        replaced rather than overwritten.
+
+        :param file_path: Path to output file
+        :param json_data: json stat metadata (without value and status)
+        :param cube: values and statuses
+        :type cube: marple.cube.Cube
+    """
+    arrays = {}
+    header = {
+        "version": VERSION,
+        "json": json_data,
+        "size": list(cube.size),
+        "sparse": cube.is_sparse,
+        "status_categories": list(cube.status_categories),
+        "arrays": {},
+    }
+    if cube.values.dtype.kind == "O":
+        header["values"] = to_value_list(cube.values)
+    else:
+        arrays["values"] = cube.values
+    if cube.status_codes is not None:
+        arrays["status_codes"] = cube.status_codes
+    if cube.is_sparse:
+        arrays["positions"] = cube.positions
+
+    offset = 0
+    for name in sorted(arrays.keys()):
+        arr = np.ascontiguousarray(arrays[name])
+        arrays[name] = arr
+        header["arrays"][name] = {
+            "dtype": arr.dtype.str,
+            "offset": offset,
+            "length": len(arr),
+        }
+        offset = _align(offset + arr.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+    header_bytes += b" " * (data_start - len(MAGIC) - 8 - len(header_bytes))
+
+    tmp_path = u"{}.{}.tmp".format(file_path, uuid.uuid4().hex)
+    try:
+        with io.open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for name in sorted(arrays.keys()):
+                f.seek(data_start + header["arrays"][name]["offset"])
+                arrays[name].tofile(f)
+        _replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_binary(file_path, mmap=False):
+    """ Read a dataset from a binary file.
+
+        :param file_path: Path to binary file
+        :param mmap: True to memory map the arrays (read only) instead of
+            reading them. Pages are then only read when they are needed,
+            and shared between processes that map the same file.
+        :returns: A tuple with json stat metadata (without value and status)
+            and a Cube
+        :raises: ValueError if this is not a binary dataset file
+    """
+    with io.open(file_path, "rb") as f:
+        header, data_start = _read_header(f)
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            if mmap and spec["length"] > 0:
+                arrays[name] = np.memmap(file_path, dtype=dtype, mode="r",
+                                         offset=data_start + spec["offset"],
+                                         shape=(spec["length"],))
+            else:
+                f.seek(data_start + spec["offset"])
+                arrays[name] = np.fromfile(f, dtype=dtype,
+                                           count=spec["length"])
+
+    return header["json"], _to_cube(header, arrays)
+
+
+def _read_header(f):
+    """ :returns: The header of an open binary file, and the position where
+            the arrays start
+    """
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Not a binary dataset file.")
+
+    header_length = struct.unpack("<Q", f.read(8))[0]
+    header = json.loads(f.read(header_length).decode("utf-8"))
+    if header["version"] > VERSION:
+        msg = "Unsupported binary format version: {}.".format(header["version"])
+        raise ValueError(msg)
+
+    return header, len(MAGIC) + 8 + header_length
+
+
+def _to_cube(header, arrays):
+    """ Create a cube from the header and arrays of a binary file
+    """
+    if "values" in header:
+        values = np.empty(len(header["values"]), dtype=object)
+        values[:] = header["values"]
+    else:
+        values = arrays["values"]
+
+    status_codes = arrays.get("status_codes")
+    if header["sparse"]:
+        return SparseCube(header["size"], arrays["positions"], values,
+                          status_codes, header["status_categories"])
+
+    return Cube(header["size"], values, status_codes,
+                header["status_categories"])
+
+
+def _replace(src, dst):
+    """ Move a file, replacing any existing file
+    """
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        # Python 2, where rename replaces existing files on posix
+        os.rename(src, dst)
+
+
+def _align(offset):
+    """ :returns: The offset rounded up to the next multiple of ALIGNMENT
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
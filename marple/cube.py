@@ -0,0 +1,1370 @@
+# encoding: utf-8
+""" Array backed storage for the values and statuses of a json stat dataset.
+
+    The json representation of a dataset keeps values and statuses as plain
+    python lists (or dicts). A `Cube` holds the same data as numpy arrays,
+    laid out in the row-major order defined by the `size` property, so that
+    large datasets can be handled without creating a python object per cell.
+
+    A `SparseCube` only holds the cells that have a value (or a status), for
+    datasets where most cells are missing.
+"""
+import operator
+import warnings
+import numpy as np
+import pandas as pd
+from pandas.api.types import (infer_dtype, is_bool_dtype, is_integer_dtype,
+    is_numeric_dtype)
+from six import string_types, text_type
+from six.moves import reduce
+
+# Ways of combining values that share position, see `resolve_duplicates`
+DUPLICATE_POLICIES = ["first", "last", "sum", "mean"]
+
+# Reductions supported by `aggregate`
+AGGREGATIONS = ["sum", "mean", "min", "max", "count"]
+
+# Comparisons supported by `period_change`
+PERIOD_CHANGES = ["diff", "pct_change"]
+
+# Datasets with a smaller share of populated cells than this are stored as
+# a SparseCube, and written with value and status on dict form.
+SPARSE_FILL_RATIO = 0.25
+
+# Results of `infer_dtype` that can be stored in a float buffer
+NUMERIC_KINDS = ["integer", "floating", "mixed-integer-float", "decimal",
+                 "empty"]
+
+
+class Cube(object):
+    """ Represents the values and statuses of a dataset as numpy arrays.
+
+        Values are stored as a flat typed array (int64 if there are no
+        missing values, float64 with NaN as null marker, or object as a
+        fallback for string values). Statuses are stored as an array of
+        integer codes pointing into `status_categories`, where code 0 always
+        represents the empty status ("").
+    """
+    is_sparse = False
+
+    def __init__(self, size, values, status_codes=None, status_categories=None):
+        """
+        :param size: The size property of the dataset
+        :type size: list
+        :param values: Flat array of values, one per cell
+        :type values: numpy.ndarray
+        :param status_codes: Flat array of status codes (or None if the
+            dataset has no statuses)
+        :type status_codes: numpy.ndarray
+        :param status_categories: List of statuses that the codes refer to.
+            First item must be "".
+        :type status_categories: list
+        """
+        self.size = tuple(int(x) for x in size)
+        self.values = values
+        self.status_codes = status_codes
+        if status_categories is None:
+            status_categories = [""]
+        self.status_categories = status_categories
+
+        if len(self.values) != self.length:
+            msg = "size factors don't match length of values. Got {}, expected {}."\
+                .format(len(self.values), self.length)
+            raise ValueError(msg)
+
+        if status_codes is not None and len(status_codes) != self.length:
+            msg = "size factors don't match length of status. Got {}, expected {}."\
+                .format(len(status_codes), self.length)
+            raise ValueError(msg)
+
+    @classmethod
+    def from_json(cls, json_data):
+        """ Create a cube from the value, status and size properties of a
+            json stat dataset.
+
+            :param json_data: A json stat dataset
+            :type json_data: dict
+            :returns: A Cube
+        """
+        if isinstance(json_data["value"], dict):
+            return SparseCube.from_json(json_data)
+
+        size = json_data["size"]
+        length = compute_length(size)
+        values = parse_values(json_data["value"], length)
+        status_codes, status_categories = parse_statuses(
+            json_data.get("status"), length)
+
+        return cls(size, values, status_codes, status_categories)
+
+    @property
+    def length(self):
+        """ :returns: Total number of cells in the cube
+        """
+        return compute_length(self.size)
+
+    @property
+    def strides(self):
+        """ :returns: The step in the flat value array for each dimension
+        """
+        if getattr(self, "_strides", None) is None:
+            self._strides = compute_strides(self.size)
+        return self._strides
+
+    @property
+    def fill_ratio(self):
+        """ :returns: Share of cells that have a value
+        """
+        if self.length == 0:
+            return 1.0
+        return float((~self.null_mask).sum()) / self.length
+
+    @property
+    def has_status(self):
+        """ :returns: True if the cube has status codes
+        """
+        return self.status_codes is not None
+
+    @property
+    def null_mask(self):
+        """ :returns: A boolean array that is True for missing values
+        """
+        return null_mask(self.values)
+
+    def value_list(self, decimals=None):
+        """ :param decimals: round numbers to a number of decimals
+            :returns: The values as a list with None for missing values
+        """
+        return to_value_list(round_values(self.values, decimals))
+
+    def status_list(self):
+        """ :returns: The statuses as a list of strings ("" if missing)
+        """
+        if self.status_codes is None:
+            return [""] * self.length
+
+        return self.status_array().tolist()
+
+    def cell_values(self, flat):
+        """ Get the values of given cells.
+
+            :param flat: numpy array of positions in the flat value array
+            :returns: numpy array of values
+        """
+        return self.values[flat]
+
+    def value_chunks(self, chunk_size, decimals=None):
+        """ Get the values a chunk at a time, see `value_list`.
+
+            :param chunk_size: max number of values per chunk
+            :param decimals: round numbers to a number of decimals
+            :returns: A generator of lists
+        """
+        for start in range(0, self.length, chunk_size):
+            values = self.values[start:start + chunk_size]
+            yield to_value_list(round_values(values, decimals))
+
+    def status_chunks(self, chunk_size):
+        """ Get the statuses a chunk at a time, see `status_list`.
+
+            :param chunk_size: max number of statuses per chunk
+            :returns: A generator of lists
+        """
+        categories = np.array(self.status_categories, dtype=object)
+        for start in range(0, self.length, chunk_size):
+            if self.status_codes is None:
+                yield [""] * min(chunk_size, self.length - start)
+            else:
+                codes = self.status_codes[start:start + chunk_size]
+                yield categories[codes].tolist()
+
+    def iter_cells(self, chunk_size, skip_null=False):
+        """ Walk through the cells a chunk at a time.
+
+            :param chunk_size: max number of cells per chunk
+            :param skip_null: leave out cells with missing values
+            :returns: A generator of tuples with positions, values and
+                status codes (or None) of the cells in a chunk
+        """
+        for start in range(0, self.length, chunk_size):
+            stop = min(start + chunk_size, self.length)
+            flat = np.arange(start, stop, dtype=np.int64)
+            values = self.values[start:stop]
+            status_codes = None
+            if self.status_codes is not None:
+                status_codes = self.status_codes[start:stop]
+
+            if skip_null:
+                keep = ~null_mask(values)
+                flat, values = flat[keep], values[keep]
+                if status_codes is not None:
+                    status_codes = status_codes[keep]
+
+            yield flat, values, status_codes
+
+    def status_array(self):
+        """ :returns: The statuses as an object array of strings
+        """
+        if self.status_codes is None:
+            return np.full(self.length, "", dtype=object)
+
+        categories = np.array(self.status_categories, dtype=object)
+        return categories[self.status_codes]
+
+    def category_codes(self, axis):
+        """ Get the category position along one dimension for every cell.
+
+            :param axis: Index of the dimension (in the id property)
+            :type axis: int
+            :returns: numpy array of ints
+        """
+        return category_codes(self.size, axis)
+
+    def take(self, positions):
+        """ Get a new cube with the categories at given positions in each
+            dimension.
+
+            :param positions: A list with one item per dimension: an array of
+                category positions, or None to keep all categories.
+            :returns: A new Cube
+        """
+        positions = [np.arange(n) if pos is None else np.asarray(pos, dtype=np.int64)
+                     for n, pos in zip(self.size, positions)]
+        size = [len(pos) for pos in positions]
+        flat = flat_positions(self.size, positions)
+
+        status_codes = None
+        if self.status_codes is not None:
+            status_codes = self.status_codes[flat]
+
+        return Cube(size, self.values[flat], status_codes,
+                    list(self.status_categories))
+
+    def transpose(self, axes):
+        """ Get a cube with the dimensions in another order.
+
+            :param axes: The new order, as positions of the current dimensions
+            :returns: A new Cube (or self if the order is unchanged)
+        """
+        axes = list(axes)
+        if axes == list(range(len(self.size))):
+            return self
+
+        size = [self.size[i] for i in axes]
+        values = self.values.reshape(self.size).transpose(axes).ravel()
+        status_codes = None
+        if self.status_codes is not None:
+            status_codes = self.status_codes.reshape(self.size)\
+                .transpose(axes).ravel()
+
+        return Cube(size, values, status_codes, list(self.status_categories))
+
+    def set_null(self, mask):
+        """ Remove the value and status of cells. Integer values are
+            converted to floats to make room for missing values.
+
+            :param mask: A boolean array that is True for cells to remove
+        """
+        if not mask.any():
+            return
+
+        if self.values.dtype.kind in "iub":
+            self.values = self.values.astype(float)
+        elif not self.values.flags.writeable:
+            # Memory mapped (or otherwise shared) values
+            self.values = self.values.copy()
+
+        if self.values.dtype.kind == "f":
+            self.values[mask] = np.nan
+        else:
+            self.values[mask] = None
+
+        if self.status_codes is not None:
+            if not self.status_codes.flags.writeable:
+                self.status_codes = self.status_codes.copy()
+            self.status_codes[mask] = 0
+
+    def copy(self):
+        """ :returns: A copy of the cube that does not share any arrays
+        """
+        status_codes = None
+        if self.status_codes is not None:
+            status_codes = self.status_codes.copy()
+
+        return Cube(self.size, self.values.copy(), status_codes,
+                    list(self.status_categories))
+
+    def with_values(self, values):
+        """ :returns: A cube with the same cells and statuses, and other
+                values (that are not copied)
+        """
+        return Cube(self.size, values, self.status_codes,
+                    list(self.status_categories))
+
+    def dense(self):
+        """ :returns: A Cube with all cells (self)
+        """
+        return self
+
+    def to_sparse(self):
+        """ :returns: A SparseCube with the cells that have a value or a
+                status
+        """
+        keep = ~self.null_mask
+        status_codes = None
+        if self.status_codes is not None:
+            keep |= self.status_codes != 0
+            status_codes = self.status_codes[keep]
+
+        return SparseCube(self.size, np.flatnonzero(keep), self.values[keep],
+                          status_codes, list(self.status_categories))
+
+
+class SparseCube(Cube):
+    """ Represents the values and statuses of a sparsely populated dataset.
+
+        Only cells with a value or a status are stored: `positions` is a
+        sorted array of positions in the (row-major) flat value array, and
+        `values` and `status_codes` hold one item per position. All other
+        cells are missing.
+    """
+    is_sparse = True
+
+    def __init__(self, size, positions, values, status_codes=None,
+                 status_categories=None):
+        """
+        :param size: The size property of the dataset
+        :type size: list
+        :param positions: Sorted array of positions of stored cells
+        :type positions: numpy.ndarray
+        :param values: Array of values, one per position
+        :type values: numpy.ndarray
+        :param status_codes: Array of status codes, one per position (or
+            None if the dataset has no statuses)
+        :type status_codes: numpy.ndarray
+        :param status_categories: List of statuses that the codes refer to.
+            First item must be "".
+        :type status_categories: list
+        """
+        self.size = tuple(int(x) for x in size)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.values = values
+        self.status_codes = status_codes
+        if status_categories is None:
+            status_categories = [""]
+        self.status_categories = status_categories
+
+        if len(self.values) != len(self.positions):
+            msg = "Got {} values for {} positions."\
+                .format(len(self.values), len(self.positions))
+            raise ValueError(msg)
+
+    @classmethod
+    def from_json(cls, json_data):
+        """ Create a sparse cube from a json stat dataset with the value
+            property on dict form.
+
+            :param json_data: A json stat dataset
+            :type json_data: dict
+            :returns: A SparseCube
+        """
+        size = json_data["size"]
+        length = compute_length(size)
+        value = json_data["value"]
+        positions = parse_positions(list(value.keys()), length, "value")
+        values = _values_to_array(list(value.values()))
+
+        status = json_data.get("status")
+        status_codes = None
+        status_categories = [""]
+        if isinstance(status, dict):
+            status_positions = parse_positions(list(status.keys()), length,
+                                               "status")
+            _codes, status_categories = encode_statuses(list(status.values()))
+        elif status is not None:
+            codes, status_categories = parse_statuses(status, length)
+            status_positions = np.flatnonzero(codes)
+            _codes = codes[status_positions]
+
+        if status is not None:
+            # Cells with a status but no value are stored as well
+            extra = np.setdiff1d(status_positions, positions)
+            if len(extra) > 0:
+                positions = np.concatenate([positions, extra])
+                values = np.concatenate([values, empty_values(len(extra),
+                    float if values.dtype.kind in "iufb" else object)])
+
+            status_codes = np.zeros(len(positions), dtype=_codes.dtype)
+            lookup = dict(zip(positions.tolist(), range(len(positions))))
+            status_codes[[lookup[x] for x in status_positions.tolist()]] = _codes
+
+        order = np.argsort(positions, kind="stable")
+        if status_codes is not None:
+            status_codes = status_codes[order]
+
+        return cls(size, positions[order], values[order], status_codes,
+                   status_categories)
+
+    @property
+    def fill_ratio(self):
+        if self.length == 0:
+            return 1.0
+        return float((~null_mask(self.values)).sum()) / self.length
+
+    @property
+    def null_mask(self):
+        return self.dense().null_mask
+
+    def value_list(self, decimals=None):
+        return self.dense().value_list(decimals)
+
+    def status_list(self):
+        return self.dense().status_list()
+
+    def status_array(self):
+        return self.dense().status_array()
+
+    def value_dict(self, decimals=None):
+        """ :param decimals: round numbers to a number of decimals
+            :returns: The values that are not missing as a dict with
+                positions (as strings) as keys
+        """
+        keep = ~null_mask(self.values)
+        values = round_values(self.values[keep], decimals)
+        return dict(zip([text_type(x) for x in self.positions[keep]],
+                        to_value_list(values)))
+
+    def value_chunks(self, chunk_size, decimals=None):
+        return self.dense().value_chunks(chunk_size, decimals)
+
+    def status_chunks(self, chunk_size):
+        return self.dense().status_chunks(chunk_size)
+
+    def cell_values(self, flat):
+        index = np.searchsorted(self.positions, flat)
+        index[index == len(self.positions)] = 0
+        found = self.positions[index] == flat if len(self.positions) > 0 \
+            else np.zeros(len(flat), dtype=bool)
+
+        dtype = float if self.values.dtype.kind in "iufb" else object
+        if found.all():
+            return self.values[index]
+
+        values = empty_values(len(flat), dtype)
+        values[found] = self.values[index[found]]
+        return values
+
+    def iter_cells(self, chunk_size, skip_null=False):
+        if skip_null:
+            # Only stored cells can have values
+            for start in range(0, len(self.positions), chunk_size):
+                chunk = slice(start, start + chunk_size)
+                values = self.values[chunk]
+                keep = ~null_mask(values)
+                status_codes = None
+                if self.status_codes is not None:
+                    status_codes = self.status_codes[chunk][keep]
+                yield self.positions[chunk][keep], values[keep], status_codes
+            return
+
+        dtype = float if self.values.dtype.kind in "iufb" else object
+        for start in range(0, self.length, chunk_size):
+            stop = min(start + chunk_size, self.length)
+            flat = np.arange(start, stop, dtype=np.int64)
+            lo, hi = np.searchsorted(self.positions, [start, stop])
+            index = self.positions[lo:hi] - start
+
+            values = empty_values(len(flat), dtype)
+            values[index] = self.values[lo:hi]
+            status_codes = None
+            if self.status_codes is not None:
+                status_codes = np.zeros(len(flat), dtype=self.status_codes.dtype)
+                status_codes[index] = self.status_codes[lo:hi]
+
+            yield flat, values, status_codes
+
+    def value_dict_chunks(self, chunk_size, decimals=None):
+        """ Get the values that are not missing a chunk at a time, see
+            `value_dict`.
+
+            :param chunk_size: max number of stored cells per chunk
+            :param decimals: round numbers to a number of decimals
+            :returns: A generator of dicts
+        """
+        for start in range(0, len(self.positions), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            values = self.values[chunk]
+            keep = ~null_mask(values)
+            positions = [text_type(x) for x in self.positions[chunk][keep]]
+            yield dict(zip(positions,
+                           to_value_list(round_values(values[keep], decimals))))
+
+    def status_dict_chunks(self, chunk_size):
+        """ Get the statuses that are not "" a chunk at a time, see
+            `status_dict`.
+
+            :param chunk_size: max number of stored cells per chunk
+            :returns: A generator of dicts
+        """
+        if self.status_codes is None:
+            return
+
+        categories = np.array(self.status_categories, dtype=object)
+        for start in range(0, len(self.positions), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            codes = self.status_codes[chunk]
+            keep = codes != 0
+            positions = [text_type(x) for x in self.positions[chunk][keep]]
+            yield dict(zip(positions, categories[codes[keep]].tolist()))
+
+    def status_dict(self):
+        """ :returns: The statuses that are not "" as a dict with positions
+                (as strings) as keys
+        """
+        if self.status_codes is None:
+            return {}
+
+        keep = self.status_codes != 0
+        categories = np.array(self.status_categories, dtype=object)
+        return dict(zip([text_type(x) for x in self.positions[keep]],
+                        categories[self.status_codes[keep]].tolist()))
+
+    def take(self, positions):
+        codes = self._codes()
+        keep = np.ones(len(self.positions), dtype=bool)
+        size = []
+        new_codes = []
+        for n, pos, dim_codes in zip(self.size, positions, codes):
+            if pos is None:
+                size.append(n)
+                new_codes.append(dim_codes)
+                continue
+
+            pos = np.asarray(pos, dtype=np.int64)
+            if len(np.unique(pos)) != len(pos):
+                # Repeated categories, cells can't be mapped one to one
+                return self.dense().take(positions).to_sparse()
+
+            lookup = np.full(n, -1, dtype=np.int64)
+            lookup[pos] = np.arange(len(pos))
+            mapped = lookup[dim_codes]
+            keep &= mapped >= 0
+            size.append(len(pos))
+            new_codes.append(mapped)
+
+        return self._from_codes(size, [x[keep] for x in new_codes], keep)
+
+    def category_codes(self, axis):
+        """ Get the category position along one dimension for every stored
+            cell.
+        """
+        return self._codes()[axis]
+
+    def transpose(self, axes):
+        axes = list(axes)
+        if axes == list(range(len(self.size))):
+            return self
+
+        codes = self._codes()
+        size = [self.size[i] for i in axes]
+        return self._from_codes(size, [codes[i] for i in axes])
+
+    def set_null(self, mask):
+        """ Remove the value and status of cells.
+
+            :param mask: A boolean array (with one item per cell, not per
+                stored cell) that is True for cells to remove
+        """
+        self.keep_stored(~mask[self.positions])
+
+    def keep_stored(self, keep):
+        """ Remove stored cells.
+
+            :param keep: A boolean array with one item per stored cell that
+                is False for cells to remove
+        """
+        if keep.all():
+            return
+
+        self.positions = self.positions[keep]
+        self.values = self.values[keep]
+        if self.status_codes is not None:
+            self.status_codes = self.status_codes[keep]
+
+    def copy(self):
+        status_codes = None
+        if self.status_codes is not None:
+            status_codes = self.status_codes.copy()
+
+        return SparseCube(self.size, self.positions.copy(), self.values.copy(),
+                          status_codes, list(self.status_categories))
+
+    def with_values(self, values):
+        return SparseCube(self.size, self.positions, values,
+                          self.status_codes, list(self.status_categories))
+
+    def dense(self):
+        """ :returns: A Cube with all cells
+        """
+        return scatter(self.size, self.positions, self.values,
+                       self.status_codes, list(self.status_categories),
+                       sparse=False)
+
+    def to_sparse(self):
+        return self
+
+    def _codes(self):
+        """ :returns: The category positions of the stored cells, per
+                dimension
+        """
+        if len(self.size) == 0:
+            return []
+        return list(np.unravel_index(self.positions, self.size))
+
+    def _from_codes(self, size, codes, keep=None):
+        """ Get a new sparse cube from category positions of the (kept)
+            stored cells.
+        """
+        values = self.values
+        status_codes = self.status_codes
+        if keep is not None:
+            values = values[keep]
+            if status_codes is not None:
+                status_codes = status_codes[keep]
+
+        flat = codes_to_flat(size, codes) if len(codes) > 0 \
+            else np.zeros(len(values), dtype=np.int64)
+        order = np.argsort(flat, kind="stable")
+        if status_codes is not None:
+            status_codes = status_codes[order]
+
+        return SparseCube(size, flat[order], values[order], status_codes,
+                          list(self.status_categories))
+
+
+def merge_cubes(size, cube1, positions1, cube2, positions2, keep="first"):
+    """ Scatter two cubes into a new cube. Cells that are in neither of
+        them are missing.
+
+        :param size: Size of the new cube
+        :param cube1: The first cube
+        :param positions1: A list with the positions of the categories of
+            cube1 in the new cube, per dimension.
+        :param cube2: The second cube (with dimensions in the same order)
+        :param positions2: Category positions of cube2 in the new cube
+        :param keep: "first"|"last", which cube to keep on overlapping cells
+        :returns: A tuple with the new cube and the number of overlapping cells
+
+        All cells of the categories of a cube count, also the ones without
+        value, so missing values of the kept cube replace values of the
+        other one. If any of the cubes is sparse, the result is sparse if it
+        is sparsely populated.
+    """
+    if cube1.is_sparse or cube2.is_sparse:
+        return _merge_sparse(size, cube1, positions1, cube2, positions2, keep)
+
+    length = compute_length(size)
+    flat1 = flat_positions(size, positions1)
+    flat2 = flat_positions(size, positions2)
+
+    occupied = np.zeros(length, dtype=bool)
+    occupied[flat1] = True
+    n_duplicates = int(occupied[flat2].sum())
+    occupied[flat2] = True
+
+    # Values
+    dtype = np.result_type(cube1.values.dtype, cube2.values.dtype)
+    if dtype.kind in "iub" and occupied.all():
+        values = np.empty(length, dtype=dtype)
+    else:
+        if dtype.kind in "iub":
+            dtype = np.dtype(float)
+        values = empty_values(length, dtype)
+
+    # Statuses
+    status_codes = None
+    categories = list(cube1.status_categories)
+    if cube1.has_status or cube2.has_status:
+        for status in cube2.status_categories:
+            if status not in categories:
+                categories.append(status)
+        status_codes = np.zeros(length, dtype=code_dtype(len(categories)))
+
+    def _scatter(cube, flat, lookup=None):
+        values[flat] = cube.values
+        if status_codes is None:
+            return
+        if cube.status_codes is None:
+            status_codes[flat] = 0
+        elif lookup is None:
+            status_codes[flat] = cube.status_codes
+        else:
+            status_codes[flat] = lookup[cube.status_codes]
+
+    lookup2 = np.array([categories.index(x) for x in cube2.status_categories],
+                       dtype=np.int64)
+    if keep == "last":
+        _scatter(cube1, flat1)
+        _scatter(cube2, flat2, lookup2)
+    else:
+        _scatter(cube2, flat2, lookup2)
+        _scatter(cube1, flat1)
+
+    return Cube(size, values, status_codes, categories), n_duplicates
+
+
+def _merge_sparse(size, cube1, positions1, cube2, positions2, keep="first"):
+    """ Merge two cubes of which at least one is sparse, see `merge_cubes`
+    """
+    categories = list(cube1.status_categories)
+    for status in cube2.status_categories:
+        if status not in categories:
+            categories.append(status)
+    has_status = cube1.has_status or cube2.has_status
+    lookup2 = np.array([categories.index(x) for x in cube2.status_categories],
+                       dtype=np.int64)
+
+    def _cells(cube, positions, lookup=None):
+        if cube.is_sparse:
+            codes = [np.asarray(pos, dtype=np.int64)[c]
+                     for pos, c in zip(positions, cube._codes())]
+            flat = codes_to_flat(size, codes) if len(codes) > 0 \
+                else np.zeros(len(cube.values), dtype=np.int64)
+        else:
+            flat = flat_positions(size, positions)
+
+        status_codes = None
+        if has_status:
+            if cube.status_codes is None:
+                status_codes = np.zeros(len(flat), dtype=np.int64)
+            elif lookup is None:
+                status_codes = cube.status_codes.astype(np.int64)
+            else:
+                status_codes = lookup[cube.status_codes]
+
+        return flat, cube.values, status_codes
+
+    cells = [_cells(cube1, positions1), _cells(cube2, positions2, lookup2)]
+
+    # Remove the stored cells of the cube that is not kept within the
+    # categories of the other, as a dense merge overwrites them
+    if keep == "last":
+        drop, other_positions = 0, positions2
+    else:
+        drop, other_positions = 1, positions1
+    keep_cells = ~_in_categories(size, cells[drop][0], other_positions)
+    cells[drop] = [None if x is None else x[keep_cells] for x in cells[drop]]
+
+    flat = np.concatenate([x[0] for x in cells])
+    values = np.concatenate([x[1] for x in cells])
+    status_codes = None
+    if has_status:
+        status_codes = np.concatenate([x[2] for x in cells])\
+            .astype(code_dtype(len(categories)))
+
+    order = np.argsort(flat, kind="stable")
+    flat, values = flat[order], values[order]
+    if status_codes is not None:
+        status_codes = status_codes[order]
+
+    n_duplicates = reduce(operator.mul,
+        [len(np.intersect1d(pos1, pos2))
+         for pos1, pos2 in zip(positions1, positions2)], 1)
+
+    cube = scatter(size, flat, values, status_codes, categories)
+    return cube, n_duplicates
+
+
+def _in_categories(size, flat, positions):
+    """ :returns: A boolean array that is True for the cells (flat
+            positions) that are within the given categories of each
+            dimension
+    """
+    mask = np.ones(len(flat), dtype=bool)
+    if len(size) == 0:
+        return mask
+
+    for n, pos, codes in zip(size, positions, np.unravel_index(flat, size)):
+        member = np.zeros(n, dtype=bool)
+        member[np.asarray(pos, dtype=np.int64)] = True
+        mask &= member[codes]
+
+    return mask
+
+
+def scatter(size, flat, values, status_codes=None, status_categories=None,
+            sparse=None):
+    """ Build a cube from values (and statuses) at given positions. Cells
+        that are not given are missing.
+
+        :param size: Size of the cube
+        :param flat: Position of every value in the flat value array
+        :param values: Array of values
+        :param status_codes: Array of status codes (optional)
+        :param status_categories: The statuses that codes refer to
+        :param sparse: True to get a SparseCube, False to get a Cube. By
+            default a SparseCube is returned if less than
+            `SPARSE_FILL_RATIO` of the cells are given.
+        :returns: A new Cube
+    """
+    length = compute_length(size)
+    if sparse is None:
+        sparse = length > 0 and len(flat) < SPARSE_FILL_RATIO * length
+
+    if sparse:
+        order = np.argsort(flat, kind="stable")
+        if status_codes is not None:
+            status_codes = status_codes[order]
+        return SparseCube(size, np.asarray(flat)[order], values[order],
+                          status_codes, status_categories)
+
+    if len(flat) == length and values.dtype.kind in "iub":
+        _values = np.empty(length, dtype=values.dtype)
+    elif values.dtype.kind in "iub":
+        _values = empty_values(length, float)
+    else:
+        _values = empty_values(length, values.dtype)
+    _values[flat] = values
+
+    _status_codes = None
+    if status_codes is not None:
+        _status_codes = np.zeros(length, dtype=status_codes.dtype)
+        _status_codes[flat] = status_codes
+
+    return Cube(size, _values, _status_codes, status_categories)
+
+
+def resolve_duplicates(flat, values, status_codes=None, how="first"):
+    """ Combine values (and statuses) that share the same position, in one
+        pass grouped by position.
+
+        - "first": keep the first value
+        - "last": keep the last value
+        - "sum": sum of non-missing values
+        - "mean": mean of non-missing values
+
+        With "sum" and "mean" the status is taken from the first row, and
+        a cell where all values are missing stays missing.
+
+        :param flat: Position of every value
+        :param values: Array of values
+        :param status_codes: Array of status codes (optional)
+        :param how: "first"|"last"|"sum"|"mean"
+        :returns: A tuple with unique positions, values and status codes
+    """
+    if how not in DUPLICATE_POLICIES:
+        msg = u"'{}' is not a valid duplicate policy. Use one of {}."\
+            .format(how, DUPLICATE_POLICIES)
+        raise ValueError(msg)
+
+    positions, first, inverse = np.unique(flat, return_index=True,
+                                          return_inverse=True)
+    inverse = inverse.ravel()
+    if how == "last":
+        reversed_first = np.unique(flat[::-1], return_index=True)[1]
+        index = len(flat) - 1 - reversed_first
+    else:
+        index = first
+
+    if status_codes is not None:
+        status_codes = status_codes[index]
+
+    if how in ["first", "last"]:
+        return positions, values[index], status_codes
+
+    if values.dtype.kind not in "iuf":
+        msg = u"Unable to {} values of type {}.".format(how, values.dtype)
+        raise ValueError(msg)
+
+    not_null = ~null_mask(values)
+    groups = inverse[not_null]
+    sums = np.bincount(groups, weights=values[not_null].astype(float),
+                       minlength=len(positions))
+    counts = np.bincount(groups, minlength=len(positions))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if how == "sum":
+            result = np.where(counts > 0, sums, np.nan)
+        else:
+            result = np.where(counts > 0, sums / counts, np.nan)
+
+    if how == "sum" and values.dtype.kind in "iu":
+        # No missing values in an integer array
+        result = result.astype(values.dtype)
+
+    return positions, result, status_codes
+
+
+def aggregate(cube, axes, how="sum"):
+    """ Reduce a cube along one or more dimensions, ignoring missing values.
+        Cells where all values are missing are missing in the result, except
+        with "count" where they are 0. Statuses are not kept.
+
+        :param cube: The cube to reduce
+        :param axes: Indexes of the dimensions to reduce
+        :param how: "sum"|"mean"|"min"|"max"|"count"
+        :returns: A new cube without the given dimensions
+    """
+    if how not in AGGREGATIONS:
+        msg = u"'{}' is not a valid aggregation. Use one of {}."\
+            .format(how, AGGREGATIONS)
+        raise ValueError(msg)
+
+    axes = sorted(set(axes))
+    size = [n for i, n in enumerate(cube.size) if i not in axes]
+    length = compute_length(size)
+    values = cube.values
+    if how != "count":
+        values = _numeric_values(values, how)
+
+    if cube.is_sparse:
+        codes = [c for i, c in enumerate(cube._codes()) if i not in axes]
+        flat = codes_to_flat(size, codes) if len(codes) > 0 \
+            else np.zeros(len(values), dtype=np.int64)
+        not_null = ~null_mask(values)
+        flat, values = flat[not_null], values[not_null]
+        if how == "count":
+            return Cube(size, np.bincount(flat, minlength=length))
+
+        result = getattr(pd.Series(values).groupby(flat), how)()
+        return scatter(size, result.index.values.astype(np.int64),
+                       result.values)
+
+    axis = tuple(axes)
+    not_null = ~null_mask(values).reshape(cube.size)
+    count = not_null.sum(axis=axis)
+    if how == "count" or cube.length == 0:
+        return Cube(size, np.asarray(count).ravel())
+
+    arr = values.reshape(cube.size)
+    if values.dtype.kind in "iu":
+        # No missing values
+        result = getattr(arr, how)(axis=axis)
+    else:
+        fn = {"sum": np.nansum, "mean": np.nanmean,
+              "min": np.nanmin, "max": np.nanmax}[how]
+        with warnings.catch_warnings():
+            # All-nan slices
+            warnings.simplefilter("ignore", RuntimeWarning)
+            result = fn(arr, axis=axis)
+        result = np.where(count > 0, result, np.nan)
+
+    return Cube(size, np.asarray(result).ravel())
+
+
+def period_change(cube, axis, sources, how="diff"):
+    """ Compare every category of a dimension with another category of the
+        same dimension (e.g. the same month last year), for all other
+        categories at once.
+
+        :param cube: The cube
+        :param axis: Index of the dimension
+        :param sources: Position of the category to compare with, per
+            category along `axis` (-1 if there is none)
+        :param how: "diff" (value - other) or "pct_change"
+            (value / other - 1)
+        :returns: A new cube with the same size. Cells without a category to
+            compare with, and with "pct_change" where the other value is 0,
+            get a missing value. Statuses are not kept.
+    """
+    if how not in PERIOD_CHANGES:
+        msg = u"'{}' is not a valid change. Use one of {}."\
+            .format(how, PERIOD_CHANGES)
+        raise ValueError(msg)
+
+    cube = cube.dense()
+    values = _numeric_values(cube.values, how)
+    sources = np.asarray(sources, dtype=np.int64)
+    missing = sources < 0
+
+    arr = values.reshape(cube.size)
+    other = np.take(arr, np.where(missing, 0, sources), axis=axis)
+    shape = [1] * len(cube.size)
+    shape[axis] = len(sources)
+    missing = np.broadcast_to(missing.reshape(shape), arr.shape)
+
+    if how == "diff":
+        result = arr - other
+        if result.dtype.kind in "iu" and not missing.any():
+            return Cube(cube.size, result.ravel())
+        result = np.where(missing, np.nan, result)
+    else:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = arr / other.astype(float) - 1
+        result = np.where(missing | (other == 0), np.nan, result)
+
+    result = Cube(cube.size, result.astype(float).ravel())
+    if result.fill_ratio < SPARSE_FILL_RATIO:
+        return result.to_sparse()
+    return result
+
+
+def rollup(cube, axis, membership, how="sum"):
+    """ Add categories to a dimension that aggregate other categories of
+        the same dimension (e.g. counties from municipalities), ignoring
+        missing values. All new categories are computed at once by
+        summing the gathered member categories of each with reduceat.
+
+        :param cube: The cube
+        :param axis: Index of the dimension
+        :param membership: A sparse membership matrix as a tuple of two
+            arrays: the new category (row) and existing category (column)
+            of each member. Every new category must have a member.
+        :param how: "sum"|"mean"
+        :returns: A new cube with the new categories last along `axis`.
+            They have no status.
+    """
+    if how not in ["sum", "mean"]:
+        msg = u"'{}' is not a valid roll up. Use one of {}."\
+            .format(how, ["sum", "mean"])
+        raise ValueError(msg)
+
+    cube = cube.dense()
+    values = _numeric_values(cube.values, how)
+    not_null = ~null_mask(values)
+
+    def _by_category(arr):
+        # Category along the first axis, all other dimensions flattened
+        return np.moveaxis(arr.reshape(cube.size), axis, 0)\
+            .reshape(cube.size[axis], -1)
+
+    def _restore(arr, n):
+        size = list(cube.size)
+        size[axis] = n
+        shape = [n] + [x for i, x in enumerate(size) if i != axis]
+        return np.moveaxis(arr.reshape(shape), 0, axis)
+
+    rows, cols = [np.asarray(x, dtype=np.int64) for x in membership]
+    order = np.argsort(rows, kind="stable")
+    rows, cols = rows[order], cols[order]
+    n_new = len(np.unique(rows))
+
+    def _sum_members(arr):
+        by_category = _by_category(arr)
+        if n_new == 0:
+            return np.zeros((0, by_category.shape[1]), dtype=by_category.dtype)
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        return np.add.reduceat(by_category[cols], starts, axis=0)
+
+    counts = _sum_members(not_null.astype(np.int64))
+    sums = _sum_members(np.where(not_null, values, 0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = sums if how == "sum" else sums / counts
+    result = np.where(counts > 0, result, np.nan)
+    if values.dtype.kind in "iu" and how == "sum" and (counts > 0).all():
+        result = result.astype(np.int64)
+
+    size = list(cube.size)
+    size[axis] += n_new
+
+    _values = np.concatenate([values.reshape(cube.size),
+                              _restore(result, n_new)], axis=axis)
+
+    status_codes = None
+    if cube.status_codes is not None:
+        new_codes = np.zeros(_restore(result, n_new).shape,
+                             dtype=cube.status_codes.dtype)
+        status_codes = np.concatenate(
+            [cube.status_codes.reshape(cube.size), new_codes], axis=axis)
+        status_codes = status_codes.ravel()
+
+    return Cube(size, _values.ravel(), status_codes,
+                list(cube.status_categories))
+
+
+def _numeric_values(values, how=None):
+    """ :returns: The values as a numeric array
+        :raises: ValueError if there are values that are not numbers
+    """
+    if values.dtype.kind in "iuf":
+        return values
+
+    try:
+        return pd.to_numeric(pd.Series(values)).astype(float).values
+    except (ValueError, TypeError):
+        msg = u"Unable to {} values that are not numbers.".format(how)
+        raise ValueError(msg)
+
+
+def codes_to_flat(size, codes):
+    """ Get the positions in the flat value array from category positions.
+
+            codes_to_flat([2, 3], [[0, 1, 1], [2, 0, 2]]) => [2, 3, 5]
+
+        :param size: The size property of a dataset
+        :param codes: A list with an array of category positions per dimension
+        :returns: numpy array of ints
+    """
+    strides = compute_strides(size)
+    n_rows = len(codes[0]) if len(codes) > 0 else 1
+    flat = np.zeros(n_rows, dtype=np.int64)
+    for dim_codes, stride in zip(codes, strides):
+        flat += np.asarray(dim_codes, dtype=np.int64) * stride
+
+    return flat
+
+
+def compute_length(size):
+    """ :returns: The number of cells of a cube with given size
+    """
+    return reduce(operator.mul, size, 1)
+
+
+def compute_strides(size):
+    """ Get the (row-major) strides for a given size. The value at category
+        positions (i, j, k) is found at i * strides[0] + j * strides[1] + k.
+
+            compute_strides([2, 3, 4]) => [12, 4, 1]
+
+        :param size: The size property of a dataset
+        :type size: list
+        :returns: a list of ints
+    """
+    strides = []
+    step = 1
+    for n in reversed(size):
+        strides.insert(0, step)
+        step *= n
+    return strides
+
+
+def flat_positions(size, positions):
+    """ Get the positions in the flat value array of all combinations of
+        category positions (like `numpy.ix_`), in row-major order.
+
+            flat_positions([2, 3], [[1], [0, 2]]) => [3, 5]
+
+        :param size: The size property of a dataset
+        :param positions: A list of category positions per dimension
+        :returns: numpy array of ints
+    """
+    strides = compute_strides(size)
+    grids = np.ix_(*[np.asarray(pos, dtype=np.int64) for pos in positions])
+    flat = np.zeros([len(pos) for pos in positions], dtype=np.int64)
+    for grid, stride in zip(grids, strides):
+        flat = flat + grid * stride
+
+    return flat.ravel()
+
+
+def flat_to_codes(size, flat):
+    """ Get the category positions of cells from their positions in the
+        flat value array (the inverse of `codes_to_flat`).
+
+            flat_to_codes([2, 3], [2, 3, 5]) => [[0, 1, 1], [2, 0, 2]]
+
+        :param size: The size property of a dataset
+        :param flat: numpy array of positions
+        :returns: A list with an array of category positions per dimension
+    """
+    return [(flat // stride) % n
+            for n, stride in zip(size, compute_strides(size))]
+
+
+def category_codes(size, axis):
+    """ Get the category position along one dimension for every cell of
+        a cube, using repeat/tile index arithmetic rather than a cartesian
+        product.
+
+            category_codes([2, 3], 0) => [0, 0, 0, 1, 1, 1]
+            category_codes([2, 3], 1) => [0, 1, 2, 0, 1, 2]
+
+        :param size: The size property of a dataset
+        :param axis: Index of the dimension
+        :returns: numpy array of ints
+    """
+    n_categories = size[axis]
+    inner = compute_length(size[axis + 1:])
+    outer = compute_length(size[:axis])
+    codes = np.repeat(np.arange(n_categories, dtype=np.int64), inner)
+    return np.tile(codes, outer)
+
+
+def code_dtype(n_categories):
+    """ :returns: The smallest unsigned integer type that can hold
+            `n_categories` codes.
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_categories <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.int64
+
+
+def null_mask(values):
+    """ :returns: A boolean array that is True where value is missing
+    """
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+    elif values.dtype.kind in "iub":
+        return np.zeros(len(values), dtype=bool)
+    else:
+        return pd.isnull(values)
+
+
+def parse_values(values, length):
+    """ Parse the value property of a json stat dataset to a typed array.
+
+        :param values: A list of values or a dict with positions as keys
+        :param length: Total number of cells
+        :returns: numpy.ndarray
+        :raises: IndexError if a position is out of range
+    """
+    if isinstance(values, dict):
+        positions = parse_positions(list(values.keys()), length, "value")
+        parsed = _values_to_array(list(values.values()))
+        if parsed.dtype.kind in "iu":
+            parsed = parsed.astype(float)
+        arr = empty_values(length, parsed.dtype)
+        arr[positions] = parsed
+        return arr
+
+    return _values_to_array(values)
+
+
+def parse_statuses(status, length):
+    """ Parse the status property of a json stat dataset to compact codes.
+
+        :param status: None, a string or a list with a single string (shared
+            by all cells), a list of strings or a dict with positions as keys.
+        :param length: Total number of cells
+        :returns: a tuple with status codes (or None) and status categories
+        :raises: IndexError if a position is out of range
+    """
+    if status is None:
+        return None, [""]
+
+    if isinstance(status, list) and len(status) == 1 and length != 1:
+        status = status[0]
+
+    if isinstance(status, string_types):
+        codes, categories = encode_statuses([status])
+        return np.full(length, codes[0], dtype=codes.dtype), categories
+
+    if isinstance(status, dict):
+        positions = parse_positions(list(status.keys()), length, "status")
+        _codes, categories = encode_statuses(list(status.values()))
+        codes = np.zeros(length, dtype=_codes.dtype)
+        codes[positions] = _codes
+        return codes, categories
+
+    return encode_statuses(status)
+
+
+def parse_positions(keys, length, prop="value"):
+    """ Parse the keys of a json stat dict (value or status) to positions.
+
+        :param keys: list of positions (as int or str)
+        :param length: Total number of cells
+        :param prop: Name of property (used in error messages)
+        :returns: numpy array of ints
+    """
+    positions = np.array([int(x) for x in keys], dtype=np.int64)
+    out_of_range = (positions < 0) | (positions >= length)
+    if out_of_range.any():
+        msg = "Error in {} property. Index {} is out of range."\
+            .format(prop, positions[out_of_range][0])
+        raise IndexError(msg)
+
+    return positions
+
+
+def encode_statuses(statuses):
+    """ Encode a list of statuses as integer codes. Missing statuses
+        (None) are treated as "".
+
+            encode_statuses(["", "x", "", "y"]) => ([0, 1, 0, 2], ["", "x", "y"])
+
+        :param statuses: list of strings
+        :returns: a tuple with codes (numpy array) and categories (list)
+    """
+    codes, uniques = pd.factorize(pd.Series(statuses, dtype=object).fillna(""))
+    categories = [""] + [x for x in uniques if x != ""]
+    lookup = np.array([categories.index(x) for x in uniques], dtype=np.int64)
+    dtype = code_dtype(len(categories))
+    if len(lookup) == 0:
+        return np.zeros(len(codes), dtype=dtype), categories
+
+    return lookup[codes].astype(dtype), categories
+
+
+def empty_values(length, dtype=float):
+    """ :returns: An array of missing values
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.full(length, np.nan, dtype=dtype)
+    return np.full(length, None, dtype=object)
+
+
+def round_values(values, decimals=None):
+    """ Round the numbers in an array of values to a given number of
+        decimals. Integers and strings are left as they are.
+
+        :param values: numpy array of values
+        :param decimals: number of decimals (None to keep all)
+        :returns: numpy array
+    """
+    if decimals is None or values.dtype.kind in "iub":
+        return values
+
+    if values.dtype.kind == "f":
+        return np.round(values, decimals)
+
+    is_float = np.array([isinstance(x, float) for x in values], dtype=bool)
+    if not is_float.any():
+        return values
+
+    rounded = values.copy()
+    rounded[is_float] = np.round(values[is_float].astype(float), decimals)
+    return rounded
+
+
+def to_value_list(values):
+    """ Turn an array of values to a json compatible list with None as
+        missing value.
+    """
+    if values.dtype.kind in "iub":
+        return values.tolist()
+
+    mask = null_mask(values)
+    if not mask.any():
+        return values.tolist()
+
+    _values = values.astype(object)
+    _values[mask] = None
+    return _values.tolist()
+
+
+def series_to_values(series):
+    """ Convert a pandas series to a typed array of values.
+
+        :param series: A column of values
+        :type series: pandas.Series
+        :returns: numpy.ndarray
+    """
+    if is_bool_dtype(series.dtype):
+        return _values_to_array(np.array(series.values, dtype=object))
+    if is_integer_dtype(series.dtype) and not series.isnull().any():
+        return series.astype(np.int64).values
+    if is_numeric_dtype(series.dtype):
+        return pd.to_numeric(series, errors="coerce").astype(float).values
+
+    values = np.array(series.values, dtype=object)
+    values[pd.isnull(values)] = None
+    return _values_to_array(values)
+
+
+def _values_to_array(values):
+    """ Convert a list of values to a typed array
+    """
+    objects = np.empty(len(values), dtype=object)
+    objects[:] = values
+    # Without nulls, as infer_dtype has no skipna option in older pandas
+    kind = infer_dtype(objects[~pd.isnull(objects)])
+    if kind in NUMERIC_KINDS:
+        arr = np.array(values, dtype=float)
+        if kind == "integer" and not np.isnan(arr).any():
+            arr = np.array(values, dtype=np.int64)
+        return arr
+
+    return objects
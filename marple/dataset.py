@@ -1,6 +1,7 @@
 # encoding: utf-8
+import gzip
+import io
 import json
-import itertools
 import operator
 from copy import deepcopy
 import pandas as pd
@@ -10,7 +11,50 @@ from six import string_types, text_type
 from six.moves import reduce
 import numpy as np
 import sys
-from marple.utils import parse_decimal
+from marple.utils import (dumps_json, guess_periodicity, subtract_periods,
+    to_timepoint)
+from marple.cube import (Cube, merge_cubes, codes_to_flat, scatter,
+    encode_statuses, series_to_values, resolve_duplicates, to_value_list,
+    parse_statuses, compute_length, flat_to_codes, aggregate, rollup,
+    period_change, SPARSE_FILL_RATIO)
+from marple.reader import read_json_stat
+from marple.binary import read_binary, write_binary
+from marple.predicate import Predicate, Context, conjuncts
+
+
+# Validation levels for datasets:
+# - "full": json schema validation and structural checks
+# - "structural": only check that id, size, dimension and value are consistent
+# - "none": no validation, for data that is known to be valid
+VALIDATION_LEVELS = ["full", "structural", "none"]
+
+# Marks a category label that is shared by several categories, see
+# `Dimension._category_lookup`
+AMBIGUOUS = -1
+
+# Compiled schema validators by schema path, see `get_schema_validator`
+_schema_validators = {}
+
+
+def get_schema_validator(schema_path):
+    """
+    Get a validator for a json schema. Validators are compiled once per
+    process and recompiled if the schema file is modified.
+
+    :param schema_path: Path to schema file
+    :type schema_path: str
+    :returns: `jsonschema.Draft4Validator`
+    """
+    mtime = os.path.getmtime(schema_path)
+    cached = _schema_validators.get(schema_path)
+    if cached is None or cached[0] != mtime:
+        with open(schema_path) as f:
+            schema = json.load(f)
+        validator = Draft4Validator(schema, format_checker=FormatChecker())
+        cached = (mtime, validator)
+        _schema_validators[schema_path] = cached
+
+    return cached[1]
 
 
 class meta_property(property):
@@ -75,10 +119,7 @@ class JSONStatObject(object):
         :type json_data: dict
         :raises: `jsonschema.exceptions.ValidationError`
         """
-        with open(schema_path) as f:
-            schema = json.load(f)
-            validator = Draft4Validator(schema, format_checker=FormatChecker())
-            validator.validate(json_data)
+        get_schema_validator(schema_path).validate(json_data)
 
     def _get_decorated_attributes(self, decorator_class):
         """
@@ -96,6 +137,19 @@ class JSONStatObject(object):
         return [attr for attr, value in attrs
                 if isinstance(value, decorator_class)]
 
+    def _meta_data(self):
+        """
+        Get the metadata of this object, defined as properties decorated
+        with `@meta_property`.
+
+        :returns: A dict with attribute names as keys
+        """
+        meta_data = {}
+        for attr in self._get_decorated_attributes(meta_property):
+            meta_data[attr] = getattr(self, attr)
+
+        return meta_data
+
     def _apply_meta_data(self, obj, on_existing="preserve"):
         """
         Take metadata from another jsonstat object (or dict) and
@@ -109,9 +163,7 @@ class JSONStatObject(object):
         :returns: self
         """
         if isinstance(obj, JSONStatObject):
-            meta_data = {}
-            for attr in obj._get_decorated_attributes(meta_property):
-                meta_data[attr] = getattr(obj, attr)
+            meta_data = obj._meta_data()
 
         elif isinstance(obj, dict):
             meta_data = obj
@@ -154,7 +206,7 @@ class Dataset(JSONStatObject):
         - note
         - error
     """
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         """
         A dataset can be initiated with:
         - A file path (to json file)
@@ -168,9 +220,27 @@ class Dataset(JSONStatObject):
         Or explicitly after:
         dataset = Dataset().from_file("path/to/jsonstat.json")
 
+        Pass `validate="structural"` or `validate="none"` to skip (parts
+        of) the validation of trusted data. When initiating from a dataframe
+        `on_duplicates` can be passed as well (see `from_dataframe`).
         """
+        validate = kwargs.pop("validate", "full")
+        on_duplicates = kwargs.pop("on_duplicates", "error")
+        if kwargs:
+            msg = u"Unexpected keyword argument(s): {}"\
+                .format(", ".join(sorted(kwargs.keys())))
+            raise TypeError(msg)
         self._json_data = None
 
+        # Array representation of values and statuses (see `marple.cube`).
+        # Built lazily from the json data, or set directly by methods that
+        # produce new data, in which case value and status are only written
+        # to the json data on demand.
+        self._cube = None
+
+        # Dimension instances by id, see `dimension`
+        self._dimensions = {}
+
         # Schema used for validation
         self._schema_path = self._make_absolute_path("schemas/jsonstat_dataset_schema.json")
 
@@ -180,18 +250,19 @@ class Dataset(JSONStatObject):
 
             if isinstance(data, dict):
                 # Init with json data
-                self.from_json(data)
+                self.from_json(data, validate=validate)
             elif isinstance(data, pd.DataFrame):
                 # Init with dataframe
-                self.from_dataframe(data)
+                self.from_dataframe(data, validate=validate,
+                    on_duplicates=on_duplicates)
             elif isinstance(data, string_types):
                 try:
                     # Init with json string
                     json_data = json.loads(data)
-                    self.from_json(json_data)
+                    self.from_json(json_data, validate=validate)
                 except ValueError:
                     # Init from json file
-                    self.from_file(data)
+                    self.from_file(data, validate=validate)
             else:
                 msg = u"Unable to init from {}".format(data)
                 raise ValueError(msg)
@@ -199,34 +270,79 @@ class Dataset(JSONStatObject):
     # ========================
     #   INITIALIZATION METHODS
     # ========================
-    def from_file(self, file_path):
+    def from_file(self, file_path, validate="full"):
         """ Parse from json file
 
+        Numeric values are parsed straight into the array representation
+        from a memory mapped file (see `marple.reader`), without going
+        through python lists.
+
         :param file_path: Path to json file.
         :type file_path: str
+        :param validate: "full"|"structural"|"none", see `VALIDATION_LEVELS`
         :returns: Itself to chain calls
         """
-        with open(file_path) as f:
+        json_data, values = read_json_stat(file_path)
+        if values is None:
+            return self.from_json(json_data, validate=validate)
 
-            json_string = f.read()
-            self.from_string(json_string)
+        try:
+            size = json_data["size"]
+            status_codes, status_categories = parse_statuses(
+                json_data.get("status"), compute_length(size))
+            cube = Cube(size, values, status_codes, status_categories)
+        except (KeyError, TypeError, ValueError, IndexError):
+            # Let the validation tell what is wrong
+            json_data["value"] = to_value_list(values)
+            return self.from_json(json_data, validate=validate)
+
+        json_data.pop("value")
+        status = json_data.get("status")
+        self._from_cube(json_data, cube, validate=validate)
+        if status is not None:
+            # Keep the status property on its original form
+            self._json_data["status"] = status
 
         return self
 
 
-    def from_string(self, json_string):
+    def from_binary(self, file_path, validate="structural", mmap=False):
+        """ Load from a binary file written by `to_binary`
+
+        The binary file was validated when it was written, so by default
+        only the structure is validated.
+
+        With `mmap=True` values and statuses are memory mapped (read only)
+        rather than read. Filtering and lookups then only read the parts of
+        the file they need, and processes that map the same file share
+        memory. Modifications produce new in-memory arrays, the file is
+        never written to.
+
+        :param file_path: Path to binary file.
+        :type file_path: str
+        :param validate: "full"|"structural"|"none", see `VALIDATION_LEVELS`
+        :param mmap: memory map values and statuses
+        :type mmap: bool
+        :returns: Itself to chain calls
+        """
+        json_data, cube = read_binary(file_path, mmap=mmap)
+        return self._from_cube(json_data, cube, validate=validate)
+
+    def from_string(self, json_string, validate="full"):
         """Parse a string containing a jsonstat and initialize this dataset
 
         :param json_string: String containing a jsonstat
         :type json_string: str
+        :param validate: "full"|"structural"|"none", see `VALIDATION_LEVELS`
         :returns: Itself to chain calls
         """
         json_data = json.loads(json_string)
-        self.from_json(json_data)
+        self.from_json(json_data, validate=validate)
 
         return self
 
-    def from_dataframe(self, df, value_column="value", status_column="status"):
+    def from_dataframe(self, df, value_column="value", status_column="status",
+        validate="full", on_duplicates="error"):
         """
         Parse a Pandas dataframe to a json stat object. Note that the created
         dataset won't have any labels, roles, units etc
@@ -237,6 +353,14 @@ class Dataset(JSONStatObject):
         :type value_column: str
         :param status_column: name of status column
         :type status_column: str
+        :param validate: "full"|"structural"|"none", see `VALIDATION_LEVELS`
+        :param on_duplicates: What to do with rows that have the same
+            categories in all dimensions:
+            - "error": raise MalformedJSONStat
+            - "first": keep the first row
+            - "last": keep the last row
+            - "sum": sum the values
+            - "mean": take the mean of the values
         :returns: Itself to chain calls
         """
         if value_column not in df.columns:
@@ -249,20 +373,6 @@ class Dataset(JSONStatObject):
 
         if has_status:
             dims.remove(status_column)
-        df = self._complete_missing(df, dims=dims)
-
-        # Make sure there are no duplicate rows
-        duplicated = df[df[dims].duplicated()]
-        n_duplicated = duplicated.shape[0]
-        if n_duplicated > 0:
-            msg = "Found {} duplicated rows in dataframe.".format(n_duplicated)
-
-        # Replace numpy NaN with None for correct json formating
-        df = df.where((pd.notnull(df)), None)
-        # As of pandas 1.3.0 the line above does not work
-        # but we keep both for backward compability
-        # https://stackoverflow.com/questions/14162723/replacing-pandas-or-numpy-nan-with-a-none-to-use-with-mysqldb/54403705#54403705
-        df = df.replace({np.nan: None})
 
         json_data = {}
 
@@ -270,6 +380,9 @@ class Dataset(JSONStatObject):
         json_data["size"] = []
         json_data["dimension"] = {}
 
+        # Category position of every row, per dimension
+        codes = []
+
         for dim in dims:
             # Populate dimensions with index
             # Dimensions and categories won't get any labels
@@ -277,7 +390,13 @@ class Dataset(JSONStatObject):
                 "label": dim,
                 "category": {},
             }
-            dim_values = list(df[dim].unique())
+            # Categories are ordered by first appearance
+            dim_codes, dim_values = pd.factorize(df[dim])
+            dim_values = list(dim_values)
+            if (dim_codes == -1).any():
+                # Missing values make up a category of their own
+                dim_codes = np.where(dim_codes == -1, len(dim_values), dim_codes)
+                dim_values.append(None)
 
             # Hackish! This might be a source of error in the future
             # But formating dimension values as strings comes natural
@@ -293,26 +412,69 @@ class Dataset(JSONStatObject):
 
             # Populate size
             json_data["size"].append(size)
+            codes.append(dim_codes)
 
-        # Populate value
-        json_data["value"] = df[value_column].tolist()
+        # Position of every row in the value array
+        flat = codes_to_flat(json_data["size"], codes)
 
+        values = series_to_values(df[value_column])
+        status_codes = None
+        status_categories = None
         if has_status:
-            status = list(df[status_column])
-            # Replace None with ""
-            # null/None not allowed as status value
-            status = ["" if x == None else x for x in status]
-            json_data["status"] = status
+            # null/None not allowed as status value, encoded as ""
+            status_codes, status_categories = encode_statuses(
+                np.array(df[status_column].values, dtype=object))
 
-        self.from_json(json_data)
+        # Handle duplicate rows
+        n_duplicated = len(flat) - len(np.unique(flat))
+        if n_duplicated > 0:
+            if on_duplicates == "error":
+                msg = "Found {} duplicated rows in dataframe.".format(n_duplicated)
+                raise MalformedJSONStat(msg)
+
+            flat, values, status_codes = resolve_duplicates(flat, values,
+                status_codes, how=on_duplicates)
+
+        # Populate value and status. Cells without a row are missing, and
+        # only given cells are stored if the dataframe is sparse.
+        cube = scatter(json_data["size"], flat, values,
+                       status_codes, status_categories)
+
+        self._from_cube(json_data, cube, validate=validate)
 
         return self
 
-    def from_json(self, json_data):
+    def _from_cube(self, json_data, cube, validate="full"):
+        """Initialize this dataset from json data without value and status,
+        and an array representation of values and statuses.
+
+        :param json_data: json structure (without value and status)
+        :type json_data: dict
+        :param cube: values and statuses
+        :type cube: marple.cube.Cube
+        :param validate: "full"|"structural"|"none", see `VALIDATION_LEVELS`
+        :returns: Itself to chain calls
+        """
+        if "class" not in json_data:
+            json_data["class"] = "dataset"
+
+        if "version" not in json_data:
+            json_data["version"] = "2.0"
+
+        self._json_data = json_data
+        self._dimensions = {}
+        self._set_cube(cube)
+
+        self._validate(json_data, level=validate)
+
+        return self
+
+    def from_json(self, json_data, validate="full"):
         """Parse a json structure and initialize this dataset
 
         :param json_data: json structure
         :dict json_data: dict
+        :param validate: "full"|"structural"|"none", see `VALIDATION_LEVELS`
         :returns: Itself to chain calls
         """
         if "class" not in json_data:
@@ -322,8 +484,10 @@ class Dataset(JSONStatObject):
             json_data["version"] = "2.0"
 
         self._json_data = json_data
+        self._cube = None
+        self._dimensions = {}
 
-        self._validate(json_data)
+        self._validate(json_data, level=validate)
 
         return self
 
@@ -335,15 +499,37 @@ class Dataset(JSONStatObject):
         """
         :returns: A json representation of the dataset as dict.
         """
+        if self._cube is not None:
+            self._materialize()
+            # The dict may be modified by the caller, so the array
+            # representation can no longer be trusted.
+            self._cube = None
+
+        # ...and neither can the cached dimensions
+        self._dimensions = {}
+
         return self._json_data
 
+    @meta_property
+    def note(self):
+        """ :returns: The note property of the dataset as list (if any).
+        """
+        try:
+            return self._json_data["note"]
+        except KeyError:
+            return None
+
+    @note.setter
+    def note(self, value):
+        self._json_data["note"] = value
+
     @meta_property
     def source(self):
         """
         :returns: The source property of the json stat object as str.
         """
         try:
-            return self.json["source"]
+            return self._json_data["source"]
         except KeyError:
             return None
 
@@ -351,7 +537,7 @@ class Dataset(JSONStatObject):
     def source(self, value):
         """ Set value of source
         """
-        self.json["source"] = value
+        self._json_data["source"] = value
 
     @meta_property
     def label(self):
@@ -359,7 +545,7 @@ class Dataset(JSONStatObject):
         :returns: The label property of the json stat object as str.
         """
         try:
-            return self.json["label"]
+            return self._json_data["label"]
         except KeyError:
             return None
 
@@ -367,7 +553,7 @@ class Dataset(JSONStatObject):
     def label(self, value):
         """ Set value of label
         """
-        self.json["label"] = value
+        self._json_data["label"] = value
 
     @meta_property
     def extension(self):
@@ -376,7 +562,7 @@ class Dataset(JSONStatObject):
         :returns: The extension property of the json stat object as dict.
         """
         try:
-            return self.json["extension"]
+            return self._json_data["extension"]
         except KeyError:
             return None
 
@@ -384,7 +570,7 @@ class Dataset(JSONStatObject):
     def extension(self, value):
         """ Set value of extension
         """
-        self.json["extension"] = value
+        self._json_data["extension"] = value
 
 
     @meta_property
@@ -393,7 +579,7 @@ class Dataset(JSONStatObject):
         :returns: The updated property of the json stat object as str.
         """
         try:
-            return self.json["updated"]
+            return self._json_data["updated"]
         except KeyError:
             return None
 
@@ -401,7 +587,7 @@ class Dataset(JSONStatObject):
     def updated(self, value):
         """ Set value of updated
         """
-        self.json["updated"] = value
+        self._json_data["updated"] = value
 
 
     @property
@@ -409,7 +595,7 @@ class Dataset(JSONStatObject):
         """
         :returns: A list of all dimensions as Dimension instances
         """
-        return [self.dimension(dim_id) for dim_id in self.json["id"]]
+        return [self.dimension(dim_id) for dim_id in self._json_data["id"]]
 
     @property
     def length(self):
@@ -417,7 +603,7 @@ class Dataset(JSONStatObject):
         Get total number of values (based on size property)
         :rtype: int
         """
-        return reduce(lambda x, y: x * y, self.json["size"])
+        return reduce(lambda x, y: x * y, self._json_data["size"])
 
     @property
     def value_list(self):
@@ -425,19 +611,11 @@ class Dataset(JSONStatObject):
         Get a list of values. Turns dict representation to list.
         :returns: A list of values
         """
-        values = self.json["value"]
+        values = self._json_data.get("value")
         if isinstance(values, list):
             return values
-        else:
-            _values = [ None for x in range(0, self.length) ]
-            for pos, value in values:
-                try:
-                    _values[pos] = value
-                except:
-                    msg = "Error in value property. Index {} is out of range."\
-                        .format(pos)
-                    raise MalformedJSONStat(msg)
-            return _values
+
+        return self._get_cube().value_list()
 
     @property
     def status_list(self):
@@ -445,21 +623,39 @@ class Dataset(JSONStatObject):
         Get a list of status values. Turns dict representation to list.
         :returns: A list of statuses
         """
-        _statuses = [ "" for x in range(0, self.length) ]
-        if "status" not in self.json:
-            return _statuses
+        if "value" in self._json_data:
+            status = self._json_data.get("status")
+            if status is None:
+                return [ "" for x in range(0, self.length) ]
+            if isinstance(status, list) and len(status) == self.length:
+                return status
 
-        if isinstance(self.json["status"], list):
-            return self.json["status"]
-        else:
-            for pos, status in self.json["status"].items():
-                try:
-                    _statuses[int(pos)] = status
-                except:
-                    msg = "Error in status property. Index {} is out of range."\
-                        .format(pos)
-                    raise MalformedJSONStat(msg)
-            return _statuses
+        return self._get_cube().status_list()
+
+    @property
+    def is_sparse(self):
+        """
+        True if only cells with values are stored (see `SPARSE_FILL_RATIO`).
+        Such datasets are written with value and status on dict form.
+        :rtype: bool
+        """
+        if self._cube is None and not isinstance(self._json_data.get("value"), dict):
+            return False
+
+        return self._get_cube().is_sparse
+
+    @property
+    def value_array(self):
+        """
+        Get the values as a (read only) numpy array shaped by the size
+        property, i.e. with one axis per dimension. Missing values are NaN
+        (or None if the dataset has string values).
+        :returns: numpy.ndarray
+        """
+        cube = self._get_cube().dense()
+        values = cube.values.reshape(cube.size)
+        values.flags.writeable = False
+        return values
 
     @property
     def all_notes(self):
@@ -490,12 +686,20 @@ class Dataset(JSONStatObject):
         :returns:
         """
         try:
-            dim_json = self.json["dimension"][dim_id]
-            return Dimension(dim_id, dim_json)
+            dim_json = self._json_data["dimension"][dim_id]
         except KeyError:
             msg = u"No dimension with id '{}'.".format(dim_id)
             raise KeyError(msg)
 
+        # Reuse the same instance (with its categories) for as long as the
+        # json of the dimension is the same
+        dim = self._dimensions.get(dim_id)
+        if dim is None or dim.json is not dim_json:
+            dim = Dimension(dim_id, dim_json)
+            self._dimensions[dim_id] = dim
+
+        return dim
+
 
     def notes_from_dictlist(self, dictlist, on_missing="pass"):
         """ Add notes from a list of dicts. Each dict should contain these keys:
@@ -593,9 +797,11 @@ class Dataset(JSONStatObject):
         :type include_status: bool
         :returns: a list of rows, first line is the header, every row is tuple
         """
-        table = self.to_table(content=content, value_column=value_column,
-            status_column="status", include_status=include_status)
-        df = pd.DataFrame(table[1:], columns=table[0])
+        header, columns = self._table_columns(content=content,
+            value_column=value_column, status_column=status_column,
+            include_status=include_status)
+        df = pd.DataFrame(dict(enumerate(columns)), columns=range(len(header)))
+        df.columns = header
         return df
 
 
@@ -621,74 +827,147 @@ class Dataset(JSONStatObject):
         :type include_status: bool
         :returns: a list of rows, first line is the header, every row is tuple
         """
-        table = []
+        header, columns = self._table_columns(content=content,
+            value_column=value_column, status_column=status_column,
+            include_status=include_status)
 
-        # header
-        if content == "label":
-            header = [dim.label for dim in self.dimensions]
-        else:
-            header = [dim.id for dim in self.dimensions]
-
-        header.append(value_column)
-        if include_status:
-            header.append(status_column)
+        # Values as python objects, with None for missing values
+        columns[len(self.dimensions)] = self.value_list
+        columns = [col.tolist() if isinstance(col, np.ndarray) else col
+                   for col in columns]
 
-        # Get id's/labels for all dimensions
-        all_categories = []
-        for dim in self.dimensions:
-            dim_categories = []
-            for cat in dim.categories:
-                if content == "label":
-                    dim_categories.append(cat.label)
-                else:
-                    dim_categories.append(cat.id)
-            all_categories.append(dim_categories)
+        return [tuple(header)] + list(zip(*columns))
 
-        # Generate a list of all id/label combinations
-        combinations = list(itertools.product(*all_categories))
+    def iter_rows(self, content="label", include_status=True, skip_null=False,
+        chunk_size=10000):
+        """Iterate over the rows of the dataset (see `to_table`) without
+        building the whole table. Rows are decoded from the array
+        representation a chunk at a time:
 
-        # Add values
-        values = [(x,) for x in self.value_list]
+            for region, gender, value, status in dataset.iter_rows():
+                ...
 
-        if include_status:
-            statuses = [(x,) for x in self.status_list]
-            table = zip(combinations, values, statuses)
-        else:
-            table = zip(combinations, values)
+        :param content: Can be "label" or "id". If labels are not defined index
+            will be used instead.
+        :param include_status: should the rows include status?
+        :type include_status: bool
+        :param skip_null: leave out rows with missing values
+        :type skip_null: bool
+        :param chunk_size: number of rows to decode at a time
+        :returns: a generator of tuples
+        """
+        for columns in self._iter_table_columns(chunk_size, content=content,
+            include_status=include_status, skip_null=skip_null):
+            columns = [col.tolist() if isinstance(col, np.ndarray) else col
+                       for col in columns]
+            for row in zip(*columns):
+                yield row
+
+    def iter_dataframes(self, chunk_size=10000, content="label",
+        value_column="value", status_column="status", include_status=True,
+        skip_null=False):
+        """Iterate over the dataset as dataframes of (at most) `chunk_size`
+        rows each, see `to_dataframe`.
+
+        :param chunk_size: max number of rows per dataframe
+        :param content: Can be "label" or "id". If labels are not defined index
+            will be used instead.
+        :param value_column: name of value column
+        :type value_column: str
+        :param status_column: name of status column
+        :type status_column: str
+        :param include_status: should the data frames inlude a status column?
+        :type include_status: bool
+        :param skip_null: leave out rows with missing values
+        :type skip_null: bool
+        :returns: a generator of pandas.DataFrame
+        """
+        header = self._table_header(content, value_column, status_column,
+            include_status)
+        for columns in self._iter_table_columns(chunk_size, content=content,
+            include_status=include_status, skip_null=skip_null):
+            if len(columns[0]) == 0:
+                continue
+            df = pd.DataFrame(dict(enumerate(columns)),
+                              columns=range(len(header)))
+            df.columns = header
+            yield df
 
-        # Flatten
-        table = [sum(row, ()) for row in table]
+    def to_json(self, decimals=None, indent=4, sort_keys=True):
+        """Format as json string.
 
-        # Add header
-        table = [tuple(header)] + table
+        Values are rounded straight from the array representation, and
+        the dataset itself is not copied. orjson is used for compact
+        output (and indent=2) if it is installed, with the same output.
 
-        return table
+        Numbers are written as floats (1.0), like before. The output is
+        otherwise valid json that differs from versions that formatted
+        values through Decimal:
 
-    def to_json(self, decimals=None):
-        """Format as json string.
+        - Non-ASCII characters are written as they are (u"ö", not "\\u00f6")
+        - Missing values are always null
+        - Dimensions keep the form of their index (list or dict) when the
+          dataset is filtered or appended to, and don't get default labels
 
         :param decimals: number of decimals of values
-        """
-        # Hack: Force N float decimals
-        from marple.utils import get_decimal_encoder
-        # Get our custom decimal encoder
-        decimal_encoder = get_decimal_encoder(prec=decimals)
-
-        # Make values Decimals
-        json_data = deepcopy(self.json)
-        json_data["value"] = list(map(parse_decimal, json_data["value"]))
+        :param indent: number of spaces to indent with, None for compact
+            output
+        :param sort_keys: sort the keys of objects
+        """
+        json_data = dict(self._json_data)
+        value, status = self._value_and_status(decimals=decimals,
+                                               cube=self._output_cube())
+        json_data["value"] = value
+        if status is not None:
+            json_data["status"] = status
 
-        return json.dumps(json_data, indent=4, sort_keys=True, cls=decimal_encoder)
+        return dumps_json(json_data, indent=indent, sort_keys=sort_keys)
 
 
-    def to_json_file(self, filename, decimals=None):
+    def to_json_file(self, filename, decimals=None, indent=4, sort_keys=True,
+        compress=None, chunk_size=100000):
         """ Save to file as json
 
+        The metadata is written first, then value and status a chunk at a
+        time straight from the array representation, so the json string
+        of the whole dataset is never held in memory. Value and status are
+        written last, after the (sorted) metadata. See `to_json` for the
+        format of the output.
+
+        :param filename: path to output file.
+        :param decimals: number of decimals of values
+        :param indent: number of spaces to indent with, None for compact
+            output
+        :param sort_keys: sort the keys of objects
+        :param compress: gzip the file. By default files ending with ".gz"
+            are compressed.
+        :param chunk_size: number of values to write at a time
+        """
+        if compress is None:
+            compress = filename.endswith(".gz")
+
+        if compress:
+            f = io.TextIOWrapper(gzip.open(filename, "wb"), encoding="utf-8")
+        else:
+            f = io.open(filename, "w", encoding="utf-8")
+
+        with f:
+            for part in self._json_parts(decimals=decimals, indent=indent,
+                sort_keys=sort_keys, chunk_size=chunk_size):
+                f.write(part)
+
+        return self
+
+    def to_binary(self, filename):
+        """ Save to a binary file (see `marple.binary`), that is much faster
+        to load than json. Load with `from_binary`.
+
         :param filename: path to output file.
         """
-        json_str = self.to_json(decimals=decimals)
-        with open(filename, 'w') as f:
-            f.write(json_str)
+        json_data = dict(self._json_data)
+        json_data.pop("value", None)
+        json_data.pop("status", None)
+        write_binary(filename, json_data, self._get_cube())
 
         return self
 
@@ -700,10 +979,31 @@ class Dataset(JSONStatObject):
     # ========================
 
     def filter(self, filter_fn, content="index", include_status=True):
-        """ Transform the dataset to dataframe and apply a filter.
-        :param filter: A function to filter by, e.g. lambda x: x['gender'] == 'M'
+        """ Filter the dataset by a predicate or a function.
+
+            Predicates (see `marple.predicate`) are evaluated on the array
+            representation of the dataset:
+
+                dataset.filter((Dim("gender") == "M") & (Value() > 10))
+
+            A function is applied row by row to the dataset as a dataframe,
+            which is much slower:
+
+                dataset.filter(lambda x: x['gender'] == 'M')
+
+            Categories without any matching cells are removed, remaining
+            cells that don't match are set to null.
+
+        :param filter_fn: A predicate, or a function to filter rows by
+        :type filter_fn: marple.predicate.Predicate|function
+        :param content: "index" to match category ids, "label" to
+            match category labels.
         :returns: self
         """
+        if isinstance(filter_fn, Predicate):
+            return self._filter_by_predicate(filter_fn, content=content,
+                include_status=include_status)
+
         df = self.to_dataframe(content=content, include_status=include_status)
         filtered_df = df[df.apply(filter_fn, axis=1)]
 
@@ -717,17 +1017,29 @@ class Dataset(JSONStatObject):
 
                 dataset.filter_by_query({"region": "Stockholms kommun"})
 
-            :param query: dimension id as key, value as value e.g. { "gender": "M" }
+            The selection is resolved to category positions per dimension and
+            values are gathered from the array representation, so the dataset
+            never passes through a dataframe.
+
+            :param query: dimension id as key, value (or list of values) as
+                value e.g. { "gender": "M" } or { "gender": ["M", "F"] }
             :type query: dict
+            :param content: "index" to match category ids, "label" to
+                match category labels.
             :returns: Self
         """
-        def filter_fn(x):
-            for dim_id, value in query.items():
-                if x[dim_id] != value:
-                    return False
-            return True
+        positions = []
+        for dim_id in query.keys():
+            # Raises KeyError on unknown dimension
+            self.dimension(dim_id)
+
+        for dim in self.dimensions:
+            if dim.id in query:
+                positions.append(dim._positions(query[dim.id], content=content))
+            else:
+                positions.append(None)
 
-        return self.filter(filter_fn, content=content, include_status=include_status)
+        return self._take(positions, include_status=include_status)
 
     def append(self, dataset_to_append, include_status=True, on_duplicates="break",
         on_metadata_conflict="preserve"):
@@ -750,7 +1062,6 @@ class Dataset(JSONStatObject):
         """
         ds1 = self
         ds2 = dataset_to_append
-        ds_orig = deepcopy(self)
 
         # Make sure that dimensions are the same in both datasets
         dims1 = [x.id for x in ds1.dimensions]
@@ -761,28 +1072,47 @@ class Dataset(JSONStatObject):
             msg = msg.format(dims1, dims2)
             raise MergeFailure(msg)
 
-
-        df1 = ds1.to_dataframe(content="index",include_status=include_status).reset_index()
-        df2 = ds2.to_dataframe(content="index",include_status=include_status).reset_index()
-
-        df = pd.concat([df1, df2])
-
-        # Handle duplicates
-        has_duplicate = df.duplicated(subset=dims)
-        if len(df[has_duplicate]) > 0:
+        # Union the categories of each dimension. Categories of the appended
+        # dataset that are new are added at the end.
+        json_data = self._copy_metadata()
+        json_data["dimension"] = {}
+        positions1 = []
+        positions2 = []
+        new_cats = {}
+        for dim_id in dims:
+            dim = ds1.dimension(dim_id)
+            cat_ids1 = [cat.id for cat in dim.categories]
+            cat_ids2 = [cat.id for cat in ds2.dimension(dim_id).categories]
+
+            lookup = dict((cat_id, i) for i, cat_id in enumerate(cat_ids1))
+            new_cats[dim_id] = [x for x in cat_ids2 if x not in lookup]
+            for cat_id in new_cats[dim_id]:
+                lookup[cat_id] = len(lookup)
+
+            positions1.append(np.arange(len(cat_ids1)))
+            positions2.append(np.array([lookup[x] for x in cat_ids2], dtype=np.int64))
+            json_data["dimension"][dim_id] = dim._append(new_cats[dim_id])
+
+        # Scatter both value arrays into the new cube
+        axes = [dims2.index(dim_id) for dim_id in dims]
+        size = [len(pos) + len(new_cats[dim_id])
+                for dim_id, pos in zip(dims, positions1)]
+        keep = "last" if on_duplicates == "update" else "first"
+        cube, n_duplicates = merge_cubes(size,
+            ds1._get_cube(), positions1,
+            ds2._get_cube().transpose(axes), positions2, keep=keep)
+
+        if n_duplicates > 0 and on_duplicates not in ["update", "preserve"]:
             if on_duplicates == "break":
                 raise MergeFailure("Failed to merge datasets. Duplicates rows found.")
-            elif on_duplicates == "update":
-                df = df.drop_duplicates(subset=dims, keep="last")
-            elif on_duplicates == "preserve":
-                df = df.drop_duplicates(subset=dims, keep="first")
             else:
                 raise Exception("'{}' is note a valid argument for 'on_duplicates'")
 
-        df = df.drop('index', axis=1)
+        if not include_status:
+            cube.status_codes = None
 
-        # Restore original metadata
-        self._rebuild(df)
+        self._json_data = json_data
+        self._set_cube(cube)
 
         # Get metadata for new categories
         self._apply_meta_data(ds2, on_existing=on_metadata_conflict)
@@ -792,10 +1122,6 @@ class Dataset(JSONStatObject):
 
             dim._apply_meta_data(dim2, on_existing=on_metadata_conflict)
 
-            dim_orig = ds_orig.dimension(dim_id)
-            cats_after_append = [ x.id for x in dim.categories ]
-            cats_before_append = [ x.id for x in dim_orig.categories ]
-
             # 1. Apply metadata from appended dataset
             for cat in dim.categories:
                 try:
@@ -805,15 +1131,322 @@ class Dataset(JSONStatObject):
                     pass
 
             # 2. Apply metadata from categories that didn't exist before
-            new_cats = list(set(cats_after_append) - set(cats_before_append))
-
-            for cat_id in new_cats:
-                new_cat = ds2.dimension(dim_id).category(cat_id)
+            for cat_id in new_cats[dim_id]:
+                new_cat = dim2.category(cat_id)
                 dim.category(cat_id)._apply_meta_data(new_cat, on_existing="update")
 
 
         return self
 
+    def get(self, **coords):
+        """ Get the value of a single cell:
+
+                dataset.get(region="Stockholm", gender="F", month="2017-01")
+
+            Categories are matched by id or label (see `Dimension.category`).
+            Dimensions with a single category can be left out.
+
+            :returns: the value (None if missing)
+            :raises: KeyError if a category is missing or doesn't exist
+        """
+        self._check_dimension_ids(coords)
+        codes = []
+        for dim in self.dimensions:
+            if dim.id in coords:
+                codes.append(dim._position(coords[dim.id]))
+            else:
+                self._check_coordinate(dim)
+                codes.append(0)
+
+        cube = self._get_cube()
+        flat = sum(code * stride for code, stride in zip(codes, cube.strides))
+        return to_value_list(cube.cell_values(np.array([flat])))[0]
+
+    def get_many(self, coords_frame):
+        """ Get the values of many cells at once. Coordinates are given as
+            a dataframe with a column per dimension:
+
+                dataset.get_many(pd.DataFrame({
+                    "region": ["Stockholm", "Solna"],
+                    "gender": ["F", "F"],
+                }))
+
+            Categories are matched by id or label (see `Dimension.category`).
+            Dimensions with a single category can be left out.
+
+            :param coords_frame: category ids (or labels) of the cells
+            :type coords_frame: pandas.DataFrame
+            :returns: the values with the index of `coords_frame`. Missing
+                values are NaN (or None if the dataset has string values).
+            :rtype: pandas.Series
+            :raises: KeyError if a category is missing or doesn't exist
+        """
+        self._check_dimension_ids(coords_frame.columns)
+        codes = []
+        for dim in self.dimensions:
+            if dim.id in coords_frame.columns:
+                dim_codes = dim._position_array(coords_frame[dim.id])
+                if (dim_codes == AMBIGUOUS).any():
+                    value = coords_frame[dim.id][dim_codes == AMBIGUOUS].iloc[0]
+                    # Raises a KeyError that tells what is wrong
+                    dim._position(value)
+                codes.append(dim_codes)
+            else:
+                self._check_coordinate(dim)
+                codes.append(np.zeros(len(coords_frame), dtype=np.int64))
+
+        cube = self._get_cube()
+        flat = codes_to_flat(cube.size, codes)
+        return pd.Series(cube.cell_values(flat), index=coords_frame.index)
+
+    def transpose(self, new_order):
+        """ Change the order of the dimensions, for example to make time
+            the innermost dimension:
+
+                dataset.transpose(["region", "gender", "month"])
+
+            Values and statuses are reordered with a single array transpose.
+            All metadata is kept.
+
+            :param new_order: all dimension ids in the new order
+            :returns: self
+        """
+        dim_ids = self._json_data["id"]
+        new_order = list(new_order)
+        if sorted(new_order) != sorted(dim_ids):
+            msg = u"New order must contain each of {} once. Got {}."\
+                .format(dim_ids, new_order)
+            raise ValueError(msg)
+
+        if new_order == dim_ids:
+            return self
+
+        axes = [dim_ids.index(dim_id) for dim_id in new_order]
+        cube = self._get_cube().transpose(axes)
+
+        json_data = dict(self._json_data)
+        json_data["id"] = new_order
+        self._json_data = json_data
+        self._set_cube(cube)
+
+        return self
+
+    def sort_categories(self, dim_id, key=None, order=None, by=None,
+        ascending=True):
+        """ Change the order of the categories of a dimension. Values and
+            statuses are reordered along the dimension. Pass one of:
+
+            - `key`: a function that takes a Category and returns a value
+              to sort by, like the key of `sorted`:
+
+                dataset.sort_categories("region", key=lambda cat: cat.label)
+
+            - `order`: a list of category ids, or a domain (or datatype) to
+              get the order of its csv files from. Categories that are not
+              in the list are put last, in their current order:
+
+                dataset.sort_categories("age", order=Domain("misc/age_groups"))
+
+            - `by`: a slice of the other dimensions to sort by the values of
+              (see `get`). Missing values are put last:
+
+                dataset.sort_categories("region", by={"year": "2018"},
+                                        ascending=False)
+
+            :param dim_id: id of dimension
+            :param ascending: sort in ascending order (with `key` and `by`)
+            :returns: self
+        """
+        if len([x for x in (key, order, by) if x is not None]) != 1:
+            raise ValueError("Pass exactly one of 'key', 'order' and 'by'.")
+
+        dim = self.dimension(dim_id)
+        categories = dim.categories
+
+        if key is not None:
+            positions = sorted(range(len(categories)),
+                               key=lambda i: key(categories[i]),
+                               reverse=not ascending)
+
+        elif order is not None:
+            if hasattr(order, "domain"):
+                # A Datatype
+                if order.domain is None:
+                    msg = u"Datatype '{}' has no domain to order by."\
+                        .format(order.id)
+                    raise ValueError(msg)
+                order = order.domain
+            if hasattr(order, "data"):
+                # A Domain
+                order = order.data.index.tolist()
+            ids = dim._category_lookup()[0]
+            positions = []
+            seen = set()
+            for cat_id in order:
+                if cat_id in ids and ids[cat_id] not in seen:
+                    positions.append(ids[cat_id])
+                    seen.add(ids[cat_id])
+            positions += [i for i in range(len(categories))
+                          if i not in seen]
+
+        else:
+            coords = dict((k, [v] * len(categories)) for k, v in by.items())
+            coords[dim_id] = [cat.id for cat in categories]
+            values = self.get_many(pd.DataFrame(coords))
+            values = pd.to_numeric(values.reset_index(drop=True))
+            positions = values.sort_values(ascending=ascending,
+                na_position="last", kind="mergesort").index.tolist()
+
+        axis = self._json_data["id"].index(dim_id)
+        all_positions = [None] * len(self._json_data["id"])
+        all_positions[axis] = np.array(positions, dtype=np.int64)
+
+        return self._take(all_positions)
+
+    def aggregate(self, over, how="sum"):
+        """ Aggregate values over one or more dimensions, for example to get
+            national totals from municipal data:
+
+                dataset.aggregate(over=["region"], how="sum")
+
+            Missing values are ignored. Cells where all values are missing
+            get a missing value (or 0 with "count"). Statuses are not kept.
+
+            :param over: id of dimension (or list of ids) to aggregate over.
+                These dimensions are removed.
+            :param how: "sum"|"mean"|"min"|"max"|"count"
+            :returns: A new dataset with the remaining dimensions and
+                their metadata
+        """
+        if isinstance(over, string_types):
+            over = [over]
+        over = list(over)
+        self._check_dimension_ids(over)
+
+        dim_ids = self._json_data["id"]
+        if set(over) == set(dim_ids):
+            raise ValueError("Can't aggregate over all dimensions.")
+
+        axes = [dim_ids.index(dim_id) for dim_id in over]
+        cube = aggregate(self._get_cube(), axes, how=how)
+
+        json_data = dict(self._json_data)
+        json_data.pop("value", None)
+        json_data.pop("status", None)
+        json_data["id"] = [x for x in dim_ids if x not in over]
+        json_data["dimension"] = dict(
+            (dim_id, dim_json) for dim_id, dim_json
+            in json_data["dimension"].items() if dim_id not in over)
+        if "role" in json_data:
+            json_data["role"] = dict(
+                (role, [x for x in role_dims if x not in over])
+                for role, role_dims in json_data["role"].items())
+
+        return Dataset()._from_cube(deepcopy(json_data), cube,
+                                    validate="structural")
+
+    def diff(self, time_dim, periods=1, periodicity=None):
+        """ Get the change from a number of periods earlier, for all series
+            at once. For example the change from the same month last year in
+            monthly data:
+
+                dataset.diff("month", periods=12)
+
+            Periods are matched by date, so gaps in the time dimension are
+            handled. Cells without a period to compare with get a missing
+            value. Statuses are not kept.
+
+            :param time_dim: id of time dimension
+            :param periods: number of periods to compare with (negative to
+                compare with later periods)
+            :param periodicity: "yearly"|"quarterly"|"monthly" etc. Guessed
+                from the categories by default.
+            :returns: A new dataset
+        """
+        return self._period_change(time_dim, periods, periodicity, "diff")
+
+    def pct_change(self, time_dim, periods=1, periodicity=None):
+        """ Get the relative change from a number of periods earlier
+            (0.05 for an increase by 5%), for all series at once. See `diff`.
+
+                dataset.pct_change("year")
+
+            Cells where the earlier value is 0 get a missing value.
+
+            :param time_dim: id of time dimension
+            :param periods: number of periods to compare with
+            :param periodicity: "yearly"|"quarterly"|"monthly" etc. Guessed
+                from the categories by default.
+            :returns: A new dataset
+        """
+        return self._period_change(time_dim, periods, periodicity,
+                                   "pct_change")
+
+    def _period_change(self, time_dim, periods, periodicity, how):
+        dim = self.dimension(time_dim)
+        sources = dim._period_sources(periods, periodicity)
+
+        axis = self._json_data["id"].index(time_dim)
+        cube = period_change(self._get_cube(), axis, sources, how=how)
+
+        json_data = dict(self._json_data)
+        json_data.pop("value", None)
+        json_data.pop("status", None)
+
+        return Dataset()._from_cube(deepcopy(json_data), cube,
+                                    validate="structural")
+
+    def rollup(self, dim_id, domain, how="sum", lang=None):
+        """ Add totals for the parents of the categories of a dimension, as
+            defined by a domain. For example counties and the whole country
+            from municipal data:
+
+                regions = Domain("regions/*")
+                dataset.rollup("region", regions)
+
+            Each parent (grandparent etc) that isn't already a category is
+            added to the dimension. Categories count towards their ancestors
+            up to the nearest one that is a category of its own, which then
+            counts further up, so no value is counted twice. Missing values
+            are ignored.
+
+            :param dim_id: id of dimension
+            :param domain: the domain of the categories, with parent
+                relations
+            :type domain: marple.datatypes.Domain|marple.datatypes.Datatype
+            :param how: "sum"|"mean"
+            :param lang: language of labels of new categories
+            :returns: A new dataset
+        """
+        if hasattr(domain, "domain"):
+            # A Datatype
+            if domain.domain is None:
+                msg = u"Datatype '{}' has no domain to roll up by."\
+                    .format(domain.id)
+                raise ValueError(msg)
+            domain = domain.domain
+
+        dim = self.dimension(dim_id)
+        new_cat_ids, membership = dim._rollup_membership(domain.parents())
+
+        axis = self._json_data["id"].index(dim_id)
+        cube = rollup(self._get_cube(), axis, membership, how=how)
+
+        json_data = dict(self._json_data)
+        json_data.pop("value", None)
+        json_data.pop("status", None)
+        json_data["dimension"] = dict(json_data["dimension"])
+        json_data["dimension"][dim_id] = dim._append(new_cat_ids)
+
+        ds = Dataset()._from_cube(deepcopy(json_data), cube,
+                                  validate="structural")
+        if len(new_cat_ids) > 0:
+            ds.dimension(dim_id).labels = dict(
+                (cat_id, domain.label(cat_id, lang=lang))
+                for cat_id in new_cat_ids)
+
+        return ds
+
     def add_labels(self, dim_id, labels):
         """Add a labels to categories of a given dimension.
 
@@ -829,57 +1462,528 @@ class Dataset(JSONStatObject):
     # ========================
     #     INTERNAL METHODS
     # ========================
-    def _validate(self, json_data):
+    def _validate(self, json_data, level="full"):
         """Validate that this is a correctly formated jsonstat dataset. Raises
         error if validation fails.
 
         :param json_data: A json stat object
         :type json_data: dict
+        :param level: "full"|"structural"|"none", see `VALIDATION_LEVELS`
         :returns: `None`
         :raises: MalformedJSONStat, `jsonschema.exceptions.ValidationError`
 
         """
+        if level not in VALIDATION_LEVELS:
+            msg = u"'{}' is not a valid validation level. Use one of {}."\
+                .format(level, VALIDATION_LEVELS)
+            raise ValueError(msg)
+
+        if level == "none":
+            return
 
         # 1. Validate against basic json schema
-        self._schema_validation(self._schema_path, json_data)
+        if level == "full":
+            if "value" not in json_data and self._cube is not None:
+                # Values are only held in the array representation. Numbers
+                # are valid by construction, other values must be checked.
+                json_data = dict(json_data)
+                values = self._cube.values
+                if values.dtype.kind == "O":
+                    json_data["value"] = to_value_list(values)
+                else:
+                    json_data["value"] = []
+            self._schema_validation(self._schema_path, json_data)
 
         # 2. Make sure that all id's are in dimension and vice versa
-        for dim_id in self.json["id"]:
-            if dim_id not in self.json["dimension"].keys():
+        for dim_id in self._json_data["id"]:
+            if dim_id not in self._json_data["dimension"].keys():
                 msg = u"'{}' missing under the dimension property.".format(dim_id)
                 raise MalformedJSONStat(msg)
 
-        for dim_id in self.json["dimension"].keys():
-            if dim_id not in self.json["id"]:
+        for dim_id in self._json_data["dimension"].keys():
+            if dim_id not in self._json_data["id"]:
                 msg = u"'{}' missing in id property.".format(dim_id)
                 raise MalformedJSONStat(msg)
 
         # 3. Make sure that size and id have same length
-        if len(self.json["size"]) != len(self.json["id"]):
+        if len(self._json_data["size"]) != len(self._json_data["id"]):
             msg = "'size' and 'id' must have same length. Now {} and {}."\
-                .format(len(self.json["size"]), len(self.json["id"]))
+                .format(len(self._json_data["size"]), len(self._json_data["id"]))
             raise MalformedJSONStat(msg)
 
 
+        # Steps 4-6 only look at the length of the raw category indexes and
+        # of value and status, so no Dimension or Category objects are
+        # created and values are not expanded.
+
         # 4. Make sure that size property counts dimension categories correctly
-        for i, _size in enumerate(self.json["size"]):
-            dim_id = self.json["id"][i]
-            dim = self.dimension(dim_id)
-            if _size != dim.length:
+        for i, _size in enumerate(self._json_data["size"]):
+            dim_id = self._json_data["id"][i]
+            category_json = self._json_data["dimension"][dim_id]["category"]
+            if "index" in category_json:
+                n_categories = len(category_json["index"])
+            else:
+                # A dimension without index has a single category
+                n_categories = len(category_json.get("label", [None]))
+            if _size != n_categories:
                 msg = "'size' property does not match length of '{}'. Got {}, expected {}."\
-                    .format(dim_id, _size, dim.length)
+                    .format(dim_id, _size, n_categories)
                 raise MalformedJSONStat(msg)
 
-
         # 5. Make sure that the size factors and value length are identical
-        if len(self.value_list) != self.length:
+        length = self.length
+        if "value" not in self._json_data and self._cube is not None:
+            if self._cube.length != length:
+                msg = "size factors don't match length of values. Got {}, expected {}."\
+                    .format(self._cube.length, length)
+                raise MalformedJSONStat(msg)
+            return
+
+        values = self._json_data["value"]
+        if isinstance(values, dict):
+            self._validate_positions(values, length, "value")
+        elif len(values) != length:
             msg = "size factors don't match length of values. Got {}, expected {}."\
-                .format(self.length, len(self.value_list))
+                .format(len(values), length)
+            raise MalformedJSONStat(msg)
+
+        # 6. Make sure that status and value have same length
+        status = self._json_data.get("status")
+        if isinstance(status, dict):
+            self._validate_positions(status, length, "status")
+        elif isinstance(status, list) and len(status) not in (1, length):
+            # A single status applies to all values
+            msg = "size factors don't match length of status. Got {}, expected {}."\
+                .format(len(status), length)
+            raise MalformedJSONStat(msg)
+
+    def _validate_positions(self, dict_data, length, prop):
+        """Make sure that the positions of a value or status dict are within
+        the bounds of the dataset.
+
+        :param dict_data: value or status property on dict form
+        :param length: number of cells in dataset
+        :param prop: name of property (for error message)
+        :raises: MalformedJSONStat
+        """
+        if len(dict_data) == 0:
+            return
+
+        try:
+            positions = [int(x) for x in dict_data.keys()]
+        except ValueError as e:
+            msg = u"Error in {} property. {}".format(prop, e)
             raise MalformedJSONStat(msg)
 
-        # 6. Make sure that status and value
-        # TODO:
-        # Validate status against value
+        for pos in (min(positions), max(positions)):
+            if pos < 0 or pos >= length:
+                msg = "Error in {} property. Index {} is out of range."\
+                    .format(prop, pos)
+                raise MalformedJSONStat(msg)
+
+    def _check_coordinate(self, dim):
+        """
+        Make sure that a dimension that is left out of a coordinate has a
+        single category.
+
+        :raises: KeyError
+        """
+        if dim.length != 1:
+            msg = u"Missing category for dimension '{}'.".format(dim.id)
+            raise KeyError(msg)
+
+    def _check_dimension_ids(self, dim_ids):
+        """
+        Make sure that all dimensions of a coordinate exist.
+
+        :raises: KeyError
+        """
+        for dim_id in dim_ids:
+            if dim_id not in self._json_data["dimension"]:
+                msg = u"No dimension with id '{}'.".format(dim_id)
+                raise KeyError(msg)
+
+    def _get_cube(self):
+        """
+        Get the array representation of values and statuses. It is parsed
+        from the json data on first access.
+
+        :returns: marple.cube.Cube
+        :raises: MalformedJSONStat
+        """
+        if self._cube is None:
+            try:
+                self._cube = Cube.from_json(self._json_data)
+            except IndexError as e:
+                raise MalformedJSONStat(text_type(e))
+
+        return self._cube
+
+    def _set_cube(self, cube):
+        """
+        Replace values and statuses with an array representation. Value
+        and status are removed from the json data until it is asked for.
+
+        :param cube: New values and statuses
+        :type cube: marple.cube.Cube
+        :returns: self
+        """
+        self._json_data.pop("value", None)
+        self._json_data.pop("status", None)
+        self._json_data["size"] = list(cube.size)
+        self._cube = cube
+
+        return self
+
+    def _materialize(self):
+        """
+        Write value and status to the json data if they are only held
+        in the array representation. Sparse datasets are written on dict
+        form as long as less than `SPARSE_FILL_RATIO` of the cells have
+        a value.
+        """
+        if self._cube is None or "value" in self._json_data:
+            return
+
+        value, status = self._value_and_status()
+        self._json_data["value"] = value
+        if status is not None:
+            self._json_data["status"] = status
+
+    def _json_parts(self, decimals=None, indent=4, sort_keys=True,
+        chunk_size=100000):
+        """
+        Serialize the dataset as a sequence of strings, see `to_json_file`.
+
+        :returns: A generator of strings
+        """
+        cube = self._output_cube()
+        has_own_status = "status" in self._json_data
+        json_data = dict(self._json_data)
+        json_data.pop("value", None)
+        if not has_own_status:
+            json_data.pop("status", None)
+
+        # Everything but the closing bracket
+        head = dumps_json(json_data, indent=indent, sort_keys=sort_keys)
+        yield head.rstrip()[:-1].rstrip()
+
+        if indent is None:
+            key_sep, item_sep, newline, item_newline = ":", ",", "", ""
+        else:
+            key_sep, item_sep = ": ", ","
+            newline = "\n" + " " * indent
+            item_newline = "\n" + " " * (2 * indent)
+
+        def _items(chunk, split_safe):
+            # Numbers (and position keys) never contain commas, so chunks
+            # of them can be dumped in one go and split on ","
+            if split_safe:
+                items = dumps_json(chunk)[1:-1]
+                items = [items] if indent is None else items.split(",")
+            elif isinstance(chunk, dict):
+                items = [u"{}:{}".format(dumps_json(k), dumps_json(v))
+                         for k, v in chunk.items()]
+            else:
+                items = [dumps_json(x) for x in chunk]
+
+            if isinstance(chunk, dict) and indent is not None:
+                items = [x.replace(u'":', u'": ', 1) for x in items]
+            return items
+
+        def _array(key, chunks, brackets, split_safe):
+            yield u"{}{}{}{}{}".format(item_sep, newline, dumps_json(key),
+                                       key_sep, brackets[0])
+            first = True
+            for chunk in chunks:
+                if len(chunk) == 0:
+                    continue
+                items = _items(chunk, split_safe)
+                yield (u"" if first else item_sep) + item_newline +\
+                    (item_sep + item_newline).join(items)
+                first = False
+            yield (u"" if first else newline) + brackets[1]
+
+        numeric = cube.values.dtype.kind != "O"
+        write_status = cube.has_status and not has_own_status
+        if cube.is_sparse and cube.fill_ratio < SPARSE_FILL_RATIO:
+            arrays = [("value", cube.value_dict_chunks(chunk_size, decimals),
+                       "{}", numeric)]
+            if write_status:
+                arrays.append(("status", cube.status_dict_chunks(chunk_size),
+                               "{}", False))
+        else:
+            arrays = [("value", cube.value_chunks(chunk_size, decimals),
+                       "[]", numeric)]
+            if write_status:
+                arrays.append(("status", cube.status_chunks(chunk_size),
+                               "[]", False))
+
+        for key, chunks, brackets, split_safe in arrays:
+            for part in _array(key, chunks, brackets, split_safe):
+                yield part
+
+        yield (u"\n" if indent is not None else u"") + u"}"
+
+    def _output_cube(self):
+        """
+        Get the array representation to write json output from. Integer
+        values are written as floats (1.0), as they always have been.
+
+        :returns: marple.cube.Cube
+        """
+        cube = self._get_cube()
+        if cube.values.dtype.kind in "iu":
+            cube = cube.with_values(cube.values.astype(float))
+
+        return cube
+
+    def _value_and_status(self, decimals=None, cube=None):
+        """
+        Get value and status on json form from the array representation.
+        If the json data has a status property of its own it is left out.
+
+        :param decimals: round numbers to a number of decimals
+        :param cube: the array representation to use, if not the one of
+            this dataset
+        :returns: A tuple with value (list or dict) and status (list, dict
+            or None)
+        """
+        if cube is None:
+            cube = self._get_cube()
+        has_own_status = "status" in self._json_data
+
+        if cube.is_sparse and cube.fill_ratio < SPARSE_FILL_RATIO:
+            value = cube.value_dict(decimals)
+            status = None if has_own_status else cube.status_dict()
+            if status is not None and len(status) == 0:
+                status = None
+            return value, status
+
+        status = None
+        if cube.has_status and not has_own_status:
+            status = cube.status_list()
+        return cube.value_list(decimals), status
+
+    def _filter_by_predicate(self, predicate, content="index", include_status=True):
+        """
+        Apply a predicate. Conditions on single dimensions in the top level
+        and-chain are resolved to category positions and gathered in one
+        go. Any remaining conditions are then evaluated cell by cell on the
+        (smaller) selection.
+
+        :param predicate: marple.predicate.Predicate
+        :returns: self
+        """
+        context = self._predicate_context(content)
+
+        # 1. Select categories
+        masks = {}
+        cell_conditions = []
+        for part in conjuncts(predicate):
+            dims = part.dimensions
+            if not part.cell_level and len(dims) == 1:
+                dim_id = list(dims)[0]
+                mask = part.category_mask(context, dim_id)
+                if dim_id in masks:
+                    mask = masks[dim_id] & mask
+                masks[dim_id] = mask
+            else:
+                cell_conditions.append(part)
+
+        positions = [np.flatnonzero(masks[dim_id]) if dim_id in masks else None
+                     for dim_id in self._json_data["id"]]
+        self._take(positions, include_status=include_status)
+
+        if len(cell_conditions) == 0:
+            return self
+
+        # 2. Evaluate remaining conditions per cell
+        cube = self._get_cube()
+        if cube.is_sparse and not self._matches_empty_cell(cell_conditions):
+            # Only stored cells can match
+            context = self._predicate_context(content)
+            keep = reduce(np.logical_and,
+                [part.cell_mask(context) for part in cell_conditions])
+            cube.keep_stored(keep)
+            self._take([np.unique(codes) for codes in cube._codes()])
+            return self
+
+        context = self._predicate_context(content, dense=True)
+        keep = reduce(np.logical_and,
+            [part.cell_mask(context) for part in cell_conditions])
+        size = cube.size
+        keep = keep.reshape(size)
+        positions = []
+        for axis in range(len(size)):
+            other_axes = tuple(i for i in range(len(size)) if i != axis)
+            positions.append(np.flatnonzero(keep.any(axis=other_axes)))
+        keep = keep[np.ix_(*positions)].ravel()
+
+        self._take(positions)
+        self._get_cube().set_null(~keep)
+
+        return self
+
+    def _matches_empty_cell(self, predicates):
+        """
+        :param predicates: A list of predicates
+        :returns: True if cells without value and status (that are not
+            stored in a SparseCube) may match all the predicates. That is
+            assumed if any of them depends on dimensions.
+        """
+        if any(len(part.dimensions) > 0 for part in predicates):
+            return True
+
+        n_dims = len(self._json_data["id"])
+        empty = Cube([1] * n_dims, np.array([np.nan]))
+        context = Context(empty, self._json_data["id"], [[None]] * n_dims)
+        return all(part.cell_mask(context)[0] for part in predicates)
+
+    def _predicate_context(self, content="index", dense=False):
+        """
+        :param content: "index" to evaluate predicates on category ids,
+            "label" to evaluate them on labels.
+        :param dense: True to evaluate predicates on all cells, also when
+            only the cells with values are stored
+        :returns: a context to evaluate predicates against
+        :rtype: marple.predicate.Context
+        """
+        categories = []
+        for dim in self.dimensions:
+            if content == "label":
+                categories.append([cat.label for cat in dim.categories])
+            else:
+                categories.append([cat.id for cat in dim.categories])
+
+        cube = self._get_cube()
+        if dense:
+            cube = cube.dense()
+
+        return Context(cube, self._json_data["id"], categories)
+
+    def _take(self, positions, include_status=True):
+        """
+        Keep the categories at given positions in each dimension. Values
+        and statuses are gathered with stride arithmetic and all metadata
+        of the remaining categories is kept.
+
+        :param positions: A list with one item per dimension: an array of
+            category positions, or None to keep all categories.
+        :type positions: list
+        :returns: self
+        """
+        if include_status and all(pos is None for pos in positions):
+            return self
+
+        cube = self._get_cube().take(positions)
+        if not include_status:
+            cube.status_codes = None
+
+        positions = dict(zip(self._json_data["id"], positions))
+        json_data = self._copy_metadata()
+        json_data["dimension"] = {}
+        for dim_id in self._json_data["dimension"].keys():
+            dim = self.dimension(dim_id)
+            if positions[dim_id] is None:
+                json_data["dimension"][dim_id] = deepcopy(dim.json)
+            else:
+                json_data["dimension"][dim_id] = dim._take(positions[dim_id])
+
+        self._json_data = json_data
+        self._set_cube(cube)
+
+        return self
+
+    def _copy_metadata(self):
+        """
+        Copy the json data, except value, status and dimensions, for a
+        dataset that is built from this one. Nothing is shared with the json
+        data of this dataset (or the data it was initiated with), so
+        metadata can be changed on one without affecting the other.
+
+        :returns: A new dict
+        """
+        return dict((key, deepcopy(value))
+                    for key, value in self._json_data.items()
+                    if key not in ("value", "status", "dimension"))
+
+    def _table_columns(self, content="label", value_column="value",
+        status_column="status", include_status=True):
+        """
+        Get the dataset as columns (one per dimension, plus value and
+        status). Dimension columns are built from category positions with
+        index arithmetic, the value column straight from the value array.
+
+        :returns: a tuple with header (list) and columns (list of arrays)
+        """
+        cube = self._get_cube().dense()
+        header = self._table_header(content, value_column, status_column,
+            include_status)
+        columns = []
+        for axis, categories in enumerate(self._table_categories(content)):
+            columns.append(categories[cube.category_codes(axis)])
+
+        columns.append(cube.values.copy())
+
+        if include_status:
+            columns.append(cube.status_array())
+
+        return header, columns
+
+    def _iter_table_columns(self, chunk_size, content="label",
+        include_status=True, skip_null=False):
+        """
+        Get the dataset as columns (see `_table_columns`) a chunk of rows at
+        a time. Category positions are decoded from the positions of the
+        cells in the flat value array.
+
+        :returns: a generator of lists of columns
+        """
+        cube = self._get_cube()
+        categories = self._table_categories(content)
+        status_categories = np.array(cube.status_categories, dtype=object)
+        for flat, values, status_codes in cube.iter_cells(chunk_size,
+            skip_null=skip_null):
+            columns = [cats[codes] for cats, codes
+                       in zip(categories, flat_to_codes(cube.size, flat))]
+            columns.append(to_value_list(values))
+            if include_status:
+                if status_codes is None:
+                    columns.append([""] * len(flat))
+                else:
+                    columns.append(status_categories[status_codes])
+            yield columns
+
+    def _table_header(self, content="label", value_column="value",
+        status_column="status", include_status=True):
+        """
+        :returns: the header of the dataset as table (a list of column names)
+        """
+        if content == "label":
+            header = [dim.label for dim in self.dimensions]
+        else:
+            header = [dim.id for dim in self.dimensions]
+
+        header.append(value_column)
+        if include_status:
+            header.append(status_column)
+
+        return header
+
+    def _table_categories(self, content="label"):
+        """
+        :returns: the category labels (or ids) of every dimension, as a list
+            of arrays
+        """
+        categories = []
+        for dim in self.dimensions:
+            if content == "label":
+                categories.append([cat.label for cat in dim.categories])
+            else:
+                categories.append([cat.id for cat in dim.categories])
+
+        return [np.array(cats, dtype=object) for cats in categories]
 
     def _rebuild(self, new_data):
         """
@@ -890,44 +1994,51 @@ class Dataset(JSONStatObject):
         :type new_data: pd.DataFrame
         :returns: self
         """
-        original_dataset = deepcopy(self)
+        snapshot = self._meta_data_snapshot()
         if isinstance(new_data, pd.DataFrame):
-            self.from_dataframe(new_data)
+            # The json data is generated from the dataframe, no need to run
+            # it through the schema.
+            self.from_dataframe(new_data, validate="structural")
         else:
             # TODO: Rebuild from other datatyps
             raise NotImplementedError()
 
-        self._apply_meta_data(original_dataset, on_existing="update")
+        self._apply_meta_data(snapshot["dataset"], on_existing="update")
 
         for dim in self.dimensions:
-            original_dimension = original_dataset.dimension(dim.id)
-            dim._apply_meta_data(original_dimension, on_existing="update")
+            dim_meta_data, cat_meta_data = snapshot["dimensions"][dim.id]
+            dim._apply_meta_data(dim_meta_data, on_existing="update")
 
             for cat in dim.categories:
-                try:
-                    original_cat = original_dimension.category(cat.id)
-                    cat._apply_meta_data(original_cat, on_existing="update")
-                except KeyError:
-                    pass
+                if cat.id in cat_meta_data:
+                    cat._apply_meta_data(cat_meta_data[cat.id], on_existing="update")
 
         return self
 
-    def _complete_missing(self, df, dims=[]):
+    def _meta_data_snapshot(self):
         """
-        Completes a long dataframe with_t
+        Get a copy of the metadata of the dataset, its dimensions and their
+        categories (see `@meta_property`). Unlike a deepcopy of the whole
+        dataset, values and statuses are not copied.
 
-        :param df: A pandas dataframe
-        :param dims: List of dimensions to index by
-        :returns: A pandas dataframe
+        :returns: A dict like:
+            {
+                "dataset": { "label": ..., "source": ... },
+                "dimensions": {
+                    "region": ({ "label": ... }, { "Solna": { "label": ... } }),
+                }
+            }
         """
-        values = [list(df[dim_id].unique()) for dim_id in dims]
-        ix = pd.MultiIndex.from_product(values, names=dims)
-        empty_df = pd.DataFrame(index=ix, columns=["empty"])
-        df = df.set_index(dims)
+        snapshot = {
+            "dataset": self._meta_data(),
+            "dimensions": {},
+        }
+        for dim in self.dimensions:
+            cat_meta_data = dict((cat.id, cat._meta_data())
+                                 for cat in dim.categories)
+            snapshot["dimensions"][dim.id] = (dim._meta_data(), cat_meta_data)
 
-        return pd.merge(df,empty_df,left_index=True, right_index=True, how='right')\
-            .reset_index()\
-            .drop('empty', axis=1)
+        return deepcopy(snapshot)
 
 
 class Dimension(JSONStatObject):
@@ -957,6 +2068,11 @@ class Dimension(JSONStatObject):
         self._schema_path = "marple_py/schemas/jsonstat_dimension_schema.json"
 
         self._categories = None
+        self._categories_source = None
+
+        # Hashed lookups of category position by id and label, see
+        # `_category_lookup`
+        self._lookup = None
 
     def __unicode__(self):
         return u"<Dimension: {}>".format(self.label)
@@ -995,7 +2111,12 @@ class Dimension(JSONStatObject):
         """
         :returns: The number of categories in index
         """
-        return len(self.categories)
+        category_json = self.json["category"]
+        if "index" not in category_json:
+            # A dimension without index has a single category
+            return 1
+
+        return len(category_json["index"])
 
     @property
     def categories(self):
@@ -1003,8 +2124,18 @@ class Dimension(JSONStatObject):
         :returns: A list of category ids for this dimension, sorted by position.
         """
 
+        category_json = self.json["category"]
+        index = category_json.get("index")
+
+        # Rebuild if category or index has been replaced
+        if self._categories_source is not None:
+            _category_json, _index = self._categories_source
+            if _category_json is not category_json or _index is not index:
+                self._categories = None
+
         if self._categories == None:
-            category_json = self.json["category"]
+            self._categories_source = (category_json, index)
+            self._lookup = None
 
             if "index" not in category_json:
                 cat_id = list(category_json["label"].keys())[0]
@@ -1018,7 +2149,7 @@ class Dimension(JSONStatObject):
 
             categories.sort(key=lambda tup: tup[1])
 
-            self._categories = [ Category(cat_id, pos, category_json)
+            self._categories = [ Category(cat_id, pos, category_json, self)
                 for (cat_id, pos) in categories ]
 
         return self._categories
@@ -1032,13 +2163,215 @@ class Dimension(JSONStatObject):
         :returns: The category
         :rtype: Category
         """
-        for category in self.categories:
-            if (category.id == id_or_label) or (category.label == id_or_label):
-                return category
+        return self.categories[self._position(id_or_label)]
+
+    def _position(self, id_or_label):
+        """
+        Get the position of a category by label or id
+
+        :param id_or_label: Id or label of category
+        :returns: The position of the category (in `categories`)
+        :rtype: int
+        """
+        ids, labels = self._category_lookup()
+        if id_or_label in ids:
+            return ids[id_or_label]
+
+        if id_or_label in labels:
+            i = labels[id_or_label]
+            if i == AMBIGUOUS:
+                msg = u"Label '{}' is used by more than one category."\
+                    .format(id_or_label)
+                raise KeyError(msg)
+            return i
 
         msg = u"No category with id or label '{}'.".format(id_or_label)
         raise KeyError(msg)
 
+    def _position_array(self, values):
+        """
+        Get the positions of many categories by label or id at once.
+
+        :param values: Ids or labels of categories
+        :type values: pandas.Series
+        :returns: A numpy array of positions, -1 where there is no (single)
+            category with that id or label
+        """
+        ids, labels = self._category_lookup()
+        lookup = dict(labels)
+        lookup.update(ids)
+        positions = pd.Series(values).map(lookup).fillna(AMBIGUOUS)
+        return positions.values.astype(np.int64)
+
+    def _category_lookup(self):
+        """
+        Get hashed lookups of category positions (in `categories`) by id
+        and by label. They are built once and reset when labels change.
+
+        Ids take precedence over labels, so a label that equals the id of
+        another category is ignored. Labels used by more than one category
+        map to `AMBIGUOUS`.
+
+        :returns: A tuple with two dicts, id => position and label => position
+        """
+        # Make sure categories (and lookups) are up to date
+        categories = self.categories
+
+        if self._lookup is None:
+            ids = {}
+            labels = {}
+            for i, category in enumerate(categories):
+                ids[category.id] = i
+                label = category.label
+                if label in labels:
+                    labels[label] = AMBIGUOUS
+                else:
+                    labels[label] = i
+
+            for cat_id, i in ids.items():
+                if cat_id in labels and labels[cat_id] != i:
+                    # Label collides with the id of another category
+                    del labels[cat_id]
+
+            self._lookup = (ids, labels)
+
+        return self._lookup
+
+
+    def _positions(self, values, content="index"):
+        """
+        Get the positions of the categories matching one or more values.
+
+        :param values: A category id or label (or list of them)
+        :param content: "index" to match ids, "label" to match labels
+        :returns: A sorted numpy array of positions
+        """
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        values = set(values)
+
+        if content == "label":
+            positions = [i for i, cat in enumerate(self.categories)
+                         if cat.label in values]
+        else:
+            ids = self._category_lookup()[0]
+            positions = sorted(ids[x] for x in values if x in ids)
+
+        return np.array(positions, dtype=np.int64)
+
+    def _period_sources(self, periods, periodicity=None):
+        """
+        Find the category that is a number of periods earlier than each
+        category of a time dimension (see `Dataset.diff`).
+
+        :param periods: number of periods
+        :param periodicity: "yearly"|"quarterly"|"monthly" etc. Guessed from
+            the first category by default.
+        :returns: An array with the position of the earlier category, or -1
+            if it is not a category, per category
+        """
+        cat_ids = [cat.id for cat in self.categories]
+        if len(cat_ids) == 0:
+            return np.array([], dtype=np.int64)
+
+        if periodicity is None:
+            periodicity = guess_periodicity(cat_ids[0])
+
+        positions = dict((to_timepoint(cat_id), i)
+                         for i, cat_id in enumerate(cat_ids))
+        return np.array([
+            positions.get(subtract_periods(cat_id, periods, periodicity), -1)
+            for cat_id in cat_ids], dtype=np.int64)
+
+    def _rollup_membership(self, parents):
+        """
+        Get the ancestors of the categories that are not categories
+        themselves, and which categories count towards each of them (see
+        `Dataset.rollup`).
+
+        :param parents: A dict with the id of the parent of categories
+        :returns: A tuple with a list of ancestor ids and a sparse
+            membership matrix: a tuple of arrays with the ancestor (row) and
+            category (column) of each member
+        """
+        cat_ids = [cat.id for cat in self.categories]
+        existing = set(cat_ids)
+        new_cat_ids = []
+        rows = {}
+        members = []
+        for col, cat_id in enumerate(cat_ids):
+            ancestor = parents.get(cat_id)
+            visited = set([cat_id])
+            while ancestor is not None and ancestor not in existing \
+                and ancestor not in visited:
+                if ancestor not in rows:
+                    rows[ancestor] = len(new_cat_ids)
+                    new_cat_ids.append(ancestor)
+                members.append((rows[ancestor], col))
+                visited.add(ancestor)
+                ancestor = parents.get(ancestor)
+
+        rows = np.array([row for row, col in members], dtype=np.int64)
+        cols = np.array([col for row, col in members], dtype=np.int64)
+
+        return new_cat_ids, (rows, cols)
+
+    def _take(self, positions):
+        """
+        Get the json of this dimension with only the categories at the
+        given positions. Category labels, notes, units etc are kept for the
+        remaining categories.
+
+        :param positions: Category positions to keep
+        :returns: A new json representation of the dimension (as dict)
+        """
+        cat_ids = [self.categories[i].id for i in positions]
+        keep = set(cat_ids)
+
+        category = {}
+        for key, value in self.json["category"].items():
+            if key == "index":
+                continue
+            elif isinstance(value, dict):
+                category[key] = dict((k, deepcopy(v)) for k, v in value.items()
+                                     if k in keep)
+            else:
+                category[key] = deepcopy(value)
+
+        if isinstance(self.json["category"].get("index"), dict):
+            category["index"] = dict(zip(cat_ids, range(len(cat_ids))))
+        else:
+            category["index"] = cat_ids
+
+        dim_json = dict((key, deepcopy(value)) for key, value
+                        in self.json.items() if key != "category")
+        dim_json["category"] = category
+
+        return dim_json
+
+    def _append(self, cat_ids):
+        """
+        Get the json of this dimension with categories added at the end.
+
+        :param cat_ids: Ids of categories to add
+        :returns: A new json representation of the dimension (as dict)
+        """
+        category = {}
+        for key, value in self.json["category"].items():
+            if key != "index":
+                category[key] = deepcopy(value)
+
+        all_cat_ids = [cat.id for cat in self.categories] + list(cat_ids)
+        if isinstance(self.json["category"].get("index"), dict):
+            category["index"] = dict(zip(all_cat_ids, range(len(all_cat_ids))))
+        else:
+            category["index"] = all_cat_ids
+
+        dim_json = dict((key, deepcopy(value)) for key, value
+                        in self.json.items() if key != "category")
+        dim_json["category"] = category
+
+        return dim_json
 
     @property
     def labels(self):
@@ -1066,6 +2399,8 @@ class Dimension(JSONStatObject):
             if cat.id in labels:
                 self.json["category"]["label"][cat.id] = labels[cat.id]
 
+        self._lookup = None
+
     @property
     def notes(self):
         """
@@ -1124,10 +2459,18 @@ class Dimension(JSONStatObject):
 
 
 class Category(JSONStatObject):
-    def __init__(self, cat_id, pos, cat_json):
+    def __init__(self, cat_id, pos, cat_json, dimension=None):
+        """
+        :param cat_id: Id of category
+        :param pos: Position of category in index
+        :param cat_json: Json data of the category property of the dimension
+        :param dimension: The dimension that the category belongs to
+        :type dimension: Dimension
+        """
         self.id = cat_id
         self.pos = pos
         self._json = cat_json
+        self._dimension = dimension
 
 
     def __unicode__(self):
@@ -1154,6 +2497,9 @@ class Category(JSONStatObject):
 
         self.json["label"][self.id] = value
 
+        if self._dimension is not None:
+            self._dimension._lookup = None
+
 
     @meta_property
     def note(self):
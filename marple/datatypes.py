@@ -108,6 +108,17 @@ class Domain(CsvFileWithLabel):
         else:
             return []
 
+    def parents(self):
+        """ Get the parent of every row that has one
+
+            :returns: a dict with id as key and id of parent as value
+        """
+        if "parent" not in self.data.columns:
+            return {}
+
+        parents = self.data["parent"].dropna()
+        return dict(zip(parents.index, parents.values))
+
     def labels(self, lang=None):
         """ Get labels for the domain
 
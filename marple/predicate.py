@@ -0,0 +1,377 @@
+# encoding: utf-8
+""" Declarative predicates for filtering datasets.
+
+    Predicates are built from dimensions, values and statuses and combined
+    with `&` (and), `|` (or) and `~` (not). For example:
+
+        from marple.predicate import Dim, Value, Status
+
+        dataset.filter(Dim("gender") == "M")
+        dataset.filter(Dim("region").isin(["Solna", "Stockholm"]) & (Value() > 100))
+        dataset.filter(Dim("month").between("2016-01", "2016-12"))
+        dataset.filter(~(Dim("region") == "Sweden") | (Status() != ""))
+
+    Conditions on dimensions are evaluated once per category rather than
+    once per cell. See `Dataset.filter` for how they are applied.
+"""
+import operator
+import numpy as np
+import pandas as pd
+from six import string_types
+from marple.cube import null_mask
+from marple.utils import to_timepoint
+
+
+class Predicate(object):
+    """ Base class for all predicates.
+    """
+    #: True if the predicate depends on values or statuses
+    cell_level = False
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def __bool__(self):
+        msg = "Predicates can't be used as booleans. Use & and | instead of 'and' and 'or'."
+        raise TypeError(msg)
+
+    __nonzero__ = __bool__
+
+    @property
+    def dimensions(self):
+        """ :returns: A set of ids of the dimensions the predicate depends on
+        """
+        raise NotImplementedError()
+
+    def category_mask(self, context, dim_id):
+        """ Evaluate the predicate for every category of a dimension. Only
+            valid for predicates that depend on that single dimension.
+
+            :param context: Evaluation context
+            :type context: Context
+            :param dim_id: Id of dimension
+            :returns: A boolean array with one item per category
+        """
+        raise NotImplementedError()
+
+    def cell_mask(self, context):
+        """ Evaluate the predicate for every cell.
+
+            :param context: Evaluation context
+            :type context: Context
+            :returns: A boolean array with one item per cell
+        """
+        raise NotImplementedError()
+
+
+class DimensionCondition(Predicate):
+    """ A condition on the categories of one dimension
+    """
+    def __init__(self, dim_id, fn):
+        """
+        :param dim_id: Id of dimension
+        :param fn: A function that takes an array of category ids (or
+            labels) and returns a boolean array.
+        """
+        self.dim_id = dim_id
+        self.fn = fn
+
+    @property
+    def dimensions(self):
+        return set([self.dim_id])
+
+    def category_mask(self, context, dim_id=None):
+        mask = self.fn(context.categories(self.dim_id))
+        return np.asarray(mask, dtype=bool)
+
+    def cell_mask(self, context):
+        return self.category_mask(context)[context.codes(self.dim_id)]
+
+
+class CellCondition(Predicate):
+    """ A condition on the value or status of every cell
+    """
+    cell_level = True
+
+    def __init__(self, fn):
+        """
+        :param fn: A function that takes a `Context` and returns a boolean
+            array with one item per cell.
+        """
+        self.fn = fn
+
+    @property
+    def dimensions(self):
+        return set()
+
+    def cell_mask(self, context):
+        return np.asarray(self.fn(context), dtype=bool)
+
+
+class And(Predicate):
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.cell_level = left.cell_level or right.cell_level
+
+    @property
+    def dimensions(self):
+        return self.left.dimensions | self.right.dimensions
+
+    def category_mask(self, context, dim_id):
+        return self.left.category_mask(context, dim_id) &\
+            self.right.category_mask(context, dim_id)
+
+    def cell_mask(self, context):
+        return self.left.cell_mask(context) & self.right.cell_mask(context)
+
+
+class Or(Predicate):
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.cell_level = left.cell_level or right.cell_level
+
+    @property
+    def dimensions(self):
+        return self.left.dimensions | self.right.dimensions
+
+    def category_mask(self, context, dim_id):
+        return self.left.category_mask(context, dim_id) |\
+            self.right.category_mask(context, dim_id)
+
+    def cell_mask(self, context):
+        return self.left.cell_mask(context) | self.right.cell_mask(context)
+
+
+class Not(Predicate):
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self.cell_level = predicate.cell_level
+
+    @property
+    def dimensions(self):
+        return self.predicate.dimensions
+
+    def category_mask(self, context, dim_id):
+        return ~self.predicate.category_mask(context, dim_id)
+
+    def cell_mask(self, context):
+        return ~self.predicate.cell_mask(context)
+
+
+class Dim(object):
+    """ Reference to a dimension, used to build predicates on its categories.
+        Categories are matched by id or label depending on the `content`
+        argument of `Dataset.filter`.
+
+            Dim("gender") == "M"
+            Dim("gender") != "M"
+            Dim("region").isin(["Solna", "Stockholm"])
+            Dim("month") >= "2016-01"
+            Dim("month").between("2016-01", "2016-12")
+
+        Ordering comparisons on time categories ("2016", "2016-01", "2016Q1"
+        etc) compare the start of the periods.
+    """
+    __hash__ = None
+
+    def __init__(self, dim_id):
+        self.dim_id = dim_id
+
+    def isin(self, values):
+        values = list(values)
+        return DimensionCondition(self.dim_id,
+            lambda categories: pd.Series(categories).isin(values).values)
+
+    def between(self, start, end):
+        """ Categories in the range [start, end] (inclusive)
+        """
+        return (self >= start) & (self <= end)
+
+    def __eq__(self, value):
+        return self.isin([value])
+
+    def __ne__(self, value):
+        return ~self.isin([value])
+
+    def __lt__(self, value):
+        return self._compare(operator.lt, value)
+
+    def __le__(self, value):
+        return self._compare(operator.le, value)
+
+    def __gt__(self, value):
+        return self._compare(operator.gt, value)
+
+    def __ge__(self, value):
+        return self._compare(operator.ge, value)
+
+    def _compare(self, op, value):
+        bound = _sortable(value)
+
+        def fn(categories):
+            return np.array([op(_sortable(x), bound) for x in categories],
+                            dtype=bool)
+
+        return DimensionCondition(self.dim_id, fn)
+
+
+class Value(object):
+    """ Reference to the values of a dataset, used to build predicates on
+        values. Missing values never match an ordering comparison.
+
+            Value() > 100
+            Value().between(0, 1)
+            Value().notnull()
+    """
+    __hash__ = None
+
+    def isnull(self):
+        return CellCondition(lambda context: null_mask(context.values))
+
+    def notnull(self):
+        return ~self.isnull()
+
+    def isin(self, values):
+        values = list(values)
+        return CellCondition(
+            lambda context: pd.Series(context.values).isin(values).values)
+
+    def between(self, low, high):
+        return (self >= low) & (self <= high)
+
+    def __eq__(self, value):
+        return CellCondition(lambda context: context.values == value)
+
+    def __ne__(self, value):
+        return CellCondition(lambda context: context.values != value)
+
+    def __lt__(self, value):
+        return self._compare(operator.lt, value)
+
+    def __le__(self, value):
+        return self._compare(operator.le, value)
+
+    def __gt__(self, value):
+        return self._compare(operator.gt, value)
+
+    def __ge__(self, value):
+        return self._compare(operator.ge, value)
+
+    def _compare(self, op, value):
+        def fn(context):
+            values = context.values
+            if values.dtype.kind == "O":
+                values = pd.to_numeric(values, errors="coerce")
+            return op(values, value)
+
+        return CellCondition(fn)
+
+
+class Status(object):
+    """ Reference to the statuses of a dataset, used to build predicates on
+        statuses. Cells without status have status "".
+
+            Status() != ""
+            Status().isin(["x", ".."])
+    """
+    __hash__ = None
+
+    def isin(self, values):
+        values = list(values)
+        return CellCondition(lambda context: context.status_mask(
+            lambda statuses: pd.Series(statuses).isin(values).values))
+
+    def __eq__(self, value):
+        return self.isin([value])
+
+    def __ne__(self, value):
+        return ~self.isin([value])
+
+
+class Context(object):
+    """ The data that predicates are evaluated against: the values and
+        statuses of a cube and the categories of its dimensions.
+
+        Cell masks have one item per cell, or per stored cell if the cube is
+        a SparseCube.
+    """
+    def __init__(self, cube, dim_ids, categories):
+        """
+        :param cube: Values and statuses
+        :type cube: marple.cube.Cube
+        :param dim_ids: Ids of the dimensions, in order
+        :param categories: A list of category ids (or labels) per dimension
+        """
+        self.cube = cube
+        self.dim_ids = list(dim_ids)
+        self._categories = [np.array(x, dtype=object) for x in categories]
+        self._codes = {}
+
+    @property
+    def values(self):
+        return self.cube.values
+
+    def axis(self, dim_id):
+        try:
+            return self.dim_ids.index(dim_id)
+        except ValueError:
+            msg = u"No dimension with id '{}'.".format(dim_id)
+            raise KeyError(msg)
+
+    def categories(self, dim_id):
+        """ :returns: category ids (or labels) of a dimension as array
+        """
+        return self._categories[self.axis(dim_id)]
+
+    def codes(self, dim_id):
+        """ :returns: the category position of every (stored) cell along a
+            dimension
+        """
+        if dim_id not in self._codes:
+            self._codes[dim_id] = self.cube.category_codes(self.axis(dim_id))
+        return self._codes[dim_id]
+
+    def status_mask(self, fn):
+        """ Evaluate a function on the distinct statuses and expand the
+            result to all cells.
+
+            :param fn: A function that takes an array of statuses and returns
+                a boolean array.
+            :returns: A boolean array with one item per (stored) cell
+        """
+        statuses = np.array(self.cube.status_categories, dtype=object)
+        mask = np.asarray(fn(statuses), dtype=bool)
+        if self.cube.status_codes is None:
+            return np.full(len(self.cube.values), mask[0], dtype=bool)
+
+        return mask[self.cube.status_codes]
+
+
+def conjuncts(predicate):
+    """ Split a predicate into the parts of a top level and-chain.
+
+        :returns: A list of predicates
+    """
+    if isinstance(predicate, And):
+        return conjuncts(predicate.left) + conjuncts(predicate.right)
+    return [predicate]
+
+
+def _sortable(value):
+    """ Make time categories comparable by their starting timepoint. Other
+        values are compared as they are.
+    """
+    if isinstance(value, string_types) or isinstance(value, int):
+        try:
+            return to_timepoint(value)
+        except ValueError:
+            pass
+    return value
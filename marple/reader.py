@@ -0,0 +1,180 @@
+# encoding: utf-8
+""" Reading of json stat files without creating a python object per value.
+
+    The file is memory mapped and only scanned for the top level value
+    property. Numeric value arrays are parsed straight into a numpy array,
+    a chunk at a time, while the rest of the file (the metadata) is parsed
+    with the json module as usual.
+"""
+import json
+import mmap
+import re
+import numpy as np
+
+STRING = br'"(?:[^"\\]|\\.)*"'
+
+# Strings and brackets, i.e. everything that affects the nesting level
+TOKEN = re.compile(STRING + br'|[\[\]{}]')
+
+ESCAPED = re.compile(br'\\.')
+
+WHITESPACE = re.compile(br'\s*')
+
+# Number of bytes of the value array to parse at a time
+CHUNK_SIZE = 1 << 22
+
+
+def read_json_stat(file_path, chunk_size=CHUNK_SIZE):
+    """ Parse a json stat file. Values are returned as a typed array if
+        the value property is a list of numbers.
+
+        :param file_path: Path to json file
+        :param chunk_size: Number of bytes of the value array to parse at
+            a time
+        :returns: A tuple with json data and values. If values could be
+            parsed, the value property of the json data is an empty list.
+            Otherwise values is None and the json data is complete.
+    """
+    with open(file_path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            data = f.read()
+
+    try:
+        values = None
+        span = find_value(data)
+        if span is not None:
+            start, end = span
+            values = parse_numbers(data, start + 1, end - 1, chunk_size)
+
+        if values is None:
+            return json.loads(data[:].decode("utf-8")), None
+
+        metadata = data[:start] + b"[]" + data[end:]
+        return json.loads(metadata.decode("utf-8")), values
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def find_value(data):
+    """ Find the value property of the top level object.
+
+        :param data: A json document (bytes or memory map)
+        :returns: start and end of the value array, or None if there is no
+            value array
+    """
+    depth = 0
+    pos = 0
+    while True:
+        match = TOKEN.search(data, pos)
+        if match is None:
+            return None
+
+        token = match.group()
+        pos = match.end()
+        if token in (b"{", b"["):
+            depth += 1
+        elif token in (b"}", b"]"):
+            depth -= 1
+        elif depth == 1:
+            colon = WHITESPACE.match(data, pos).end()
+            if data[colon:colon + 1] != b":":
+                continue
+
+            # A key of the top level object
+            start = WHITESPACE.match(data, colon + 1).end()
+            if data[start:start + 1] != b"[":
+                if token == b'"value"':
+                    return None
+                continue
+
+            if token == b'"value"':
+                end = data.find(b"]", start)
+                if end == -1 or data.find(b"[", start + 1, end) != -1:
+                    return None
+                return start, end + 1
+
+            if token == b'"status"':
+                # Skip the (flat) array of statuses in one go
+                end = _string_array_end(data, start)
+                if end is not None:
+                    pos = end
+
+
+def _string_array_end(data, start):
+    """ :returns: The position after the "]" that closes an array of
+            strings, or None
+    """
+    pos = start
+    while True:
+        end = data.find(b"]", pos)
+        if end == -1:
+            return None
+
+        # The bracket is outside strings if it is preceded by an even
+        # number of (unescaped) quotes
+        chunk = ESCAPED.sub(b"", data[start:end])
+        if chunk.count(b'"') % 2 == 0:
+            return end + 1
+        pos = end + 1
+
+
+def parse_numbers(data, start, end, chunk_size=CHUNK_SIZE):
+    """ Parse the items of a json array of numbers (and nulls).
+
+        :param data: A json document (bytes or memory map)
+        :param start: Position after "["
+        :param end: Position of "]"
+        :param chunk_size: Number of bytes to parse at a time
+        :returns: An int64 array if all items are integers, a float64 array
+            with NaN for nulls otherwise. None if there are other items.
+    """
+    chunks = []
+    pos = start
+    while pos < end:
+        stop = min(pos + chunk_size, end)
+        if stop < end:
+            # Split between two items
+            comma = data.rfind(b",", pos, stop)
+            if comma == -1:
+                comma = data.find(b",", stop, end)
+            stop = end if comma == -1 else comma
+
+        chunk = data[pos:stop]
+        pos = stop + 1
+        if not chunk.strip() and not chunks and pos >= end:
+            # Empty array
+            break
+
+        parsed = _parse_number_chunk(chunk)
+        if parsed is None:
+            return None
+        chunks.append(parsed)
+
+    if len(chunks) == 0:
+        return np.array([], dtype=float)
+
+    if any(x.dtype.kind == "f" for x in chunks):
+        return np.concatenate([x.astype(float) for x in chunks])
+
+    return np.concatenate(chunks)
+
+
+def _parse_number_chunk(chunk):
+    """ Parse comma separated numbers (and nulls)
+    """
+    if b'"' in chunk:
+        return None
+
+    is_integer = not any(x in chunk for x in (b".", b"e", b"E", b"n", b"N"))
+    try:
+        if is_integer:
+            return np.array(chunk.split(b","), dtype=np.int64)
+
+        tokens = chunk.replace(b"null", b"nan").split(b",")
+        return np.array(tokens, dtype=float)
+    except (ValueError, OverflowError):
+        return None
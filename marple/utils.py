@@ -12,6 +12,16 @@ import numpy as np
 import pandas as pd
 from six import string_types, text_type
 
+try:
+    # Optional, much faster json serialization
+    import orjson
+except ImportError:
+    orjson = None
+
+# Floats that orjson formats differently from the json module (1e16 vs
+# 1e+16, 0.00001 vs 1e-05). May also match inside strings.
+ORJSON_FLOAT_MISMATCH = re.compile(r"[0-9]e[+-]?[0-9]|0\.0000")
+
 def get_timepoint_label(datestring, periodicity):
     """ Convert a datestring to a timepoint label.
         :param datestring: an iso coded datestring. E.g. "2016-01-01"
@@ -114,7 +124,7 @@ def subtract_periods(timepoint, n_periods, periodicity=None):
 
     :param timepoint (str|int): a timepoint
     :param n_periods (str): number of periods
-    :param periodicity (str): "monthly"|"yearly"|"rolling_quarter"|"rolling_year"
+    :param periodicity (str): "monthly"|"quarterly"|"yearly"|"rolling_quarter"|"rolling_year"
     :returns: computed timepoint as string
     """
     if periodicity is None:
@@ -125,11 +135,13 @@ def subtract_periods(timepoint, n_periods, periodicity=None):
 
     if periodicity in ["monthly", "rolling_quarter", "rolling_year"]:
         dt -= relativedelta(months=n_periods)
+    elif periodicity == "quarterly":
+        dt -= relativedelta(months=n_periods * 3)
     elif periodicity in ["yearly", "school_year"]:
         dt -= relativedelta(years=n_periods)
     else:
         msg = u"Unable to subtract periods for periodicity '{}'".format(periodicity)
-        NotImplementedError(msg)
+        raise NotImplementedError(msg)
 
     return datetime.strftime(dt, "%Y-%m-%d")
 
@@ -297,3 +309,58 @@ def get_decimal_encoder(prec=None, BaseEncoder=json.JSONEncoder):
     DecimalEncoder.PRECISION = prec
 
     return DecimalEncoder
+
+
+def dumps_json(data, indent=None, sort_keys=False):
+    """Serialize to a json string. Uses orjson if it is installed (and
+    the indentation is supported by it), otherwise the standard library.
+    Both give the same output: orjson is only used when it formats the data
+    exactly like the json module. NaN and infinity are written as null.
+
+    :param data: json compatible data
+    :param indent (int): None for compact output, or number of spaces to
+        indent with
+    :param sort_keys (bool): sort the keys of objects
+    :returns: a json string
+    """
+    if orjson is not None and indent in (None, 2):
+        option = 0
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            # orjson sorts non-string keys as strings and json by value, so
+            # those are left to the json module
+            option |= orjson.OPT_SORT_KEYS
+        else:
+            option |= orjson.OPT_NON_STR_KEYS
+        try:
+            dumped = orjson.dumps(data, option=option).decode("utf-8")
+        except TypeError:
+            # E.g. integers larger than 64 bits
+            dumped = None
+        if dumped is not None and not ORJSON_FLOAT_MISMATCH.search(dumped):
+            return dumped
+
+    separators = (",", ":") if indent is None else (",", ": ")
+    try:
+        return json.dumps(data, indent=indent, sort_keys=sort_keys,
+                          separators=separators, ensure_ascii=False,
+                          allow_nan=False)
+    except ValueError as e:
+        if "Out of range float" not in text_type(e):
+            raise
+        return json.dumps(_nan_to_none(data), indent=indent,
+                          sort_keys=sort_keys, separators=separators,
+                          ensure_ascii=False)
+
+
+def _nan_to_none(data):
+    """Replace NaN and infinity with None in json compatible data
+    """
+    if isinstance(data, float):
+        return None if np.isnan(data) or np.isinf(data) else data
+    if isinstance(data, dict):
+        return dict((key, _nan_to_none(value)) for key, value in data.items())
+    if isinstance(data, (list, tuple)):
+        return [_nan_to_none(value) for value in data]
+    return data
@@ -230,3 +230,24 @@ wrong_value_length_dataset = {
         }
     }
 }
+
+# 10x10 dataset with few values, stored sparse
+sparse_dataset = {
+    "version": "2.0",
+    "class": "dataset",
+    "id": ["region", "year"],
+    "size": [10, 10],
+    "dimension": {
+        "region": {"category": {"index": [str(x) for x in range(10)]}},
+        "year": {"category": {"index": [str(2000 + x) for x in range(10)]}},
+    },
+    "value": {"0": 1, "11": 2, "15": 4, "99": 3},
+    "status": {"11": "x", "55": "y"},
+}
+
+# One value per region and year, i.e. a sparse 10x10 dataset
+sparse_table_data = {
+    "region": [str(x) for x in range(10)],
+    "year": [str(2000 + x) for x in range(10)],
+    "value": list(range(10)),
+}
@@ -0,0 +1,150 @@
+# encoding: utf-8
+
+import pytest
+import numpy as np
+
+from marple.cube import (Cube, compute_strides, encode_statuses, merge_cubes,
+    parse_values, parse_statuses, resolve_duplicates, flat_to_codes, codes_to_flat,
+    rollup)
+
+
+def test_compute_strides():
+    assert compute_strides([2, 3, 4]) == [12, 4, 1]
+    assert compute_strides([5]) == [1]
+
+
+def test_parse_values_keeps_type():
+    assert parse_values([1, 2, 3], 3).dtype == np.int64
+    assert parse_values([1, None, 3], 3).dtype == np.float64
+    assert parse_values(["a", None], 2).dtype == object
+
+
+def test_parse_values_from_dict():
+    values = parse_values({"1": 5, 3: 7}, 4)
+    assert np.isnan(values[0])
+    assert values[1] == 5
+    assert values[3] == 7
+
+    with pytest.raises(IndexError):
+        parse_values({"4": 1}, 4)
+
+
+def test_encode_statuses():
+    codes, categories = encode_statuses(["x", "", "y", "x"])
+    assert categories == ["", "x", "y"]
+    assert codes.tolist() == [1, 0, 2, 1]
+    assert codes.dtype == np.uint8
+
+
+def test_parse_statuses():
+    codes, categories = parse_statuses({1: "x"}, 3)
+    assert codes.tolist() == [0, 1, 0]
+    assert categories == ["", "x"]
+
+    codes, categories = parse_statuses("e", 2)
+    assert [categories[x] for x in codes] == ["e", "e"]
+
+    assert parse_statuses(None, 2) == (None, [""])
+
+
+def test_cube_to_lists():
+    cube = Cube.from_json({
+        "size": [2, 2],
+        "value": [1.5, None, 3, 4],
+        "status": ["", "x", "", ""],
+    })
+    assert cube.value_list() == [1.5, None, 3, 4]
+    assert cube.status_list() == ["", "x", "", ""]
+    assert cube.null_mask.tolist() == [False, True, False, False]
+
+
+def test_cube_with_wrong_length():
+    with pytest.raises(ValueError):
+        Cube([2, 2], np.arange(3))
+
+
+def test_category_codes():
+    cube = Cube([2, 3], np.arange(6))
+    assert cube.category_codes(0).tolist() == [0, 0, 0, 1, 1, 1]
+    assert cube.category_codes(1).tolist() == [0, 1, 2, 0, 1, 2]
+
+
+def test_take():
+    cube = Cube([2, 3], np.arange(6), np.array([0, 1, 0, 0, 0, 2]), ["", "x", "y"])
+    subset = cube.take([[1], [0, 2]])
+    assert subset.size == (1, 2)
+    assert subset.values.tolist() == [3, 5]
+    assert subset.status_list() == ["", "y"]
+
+
+def test_merge_cubes():
+    cube1 = Cube([1, 2], np.array([1, 2]))
+    cube2 = Cube([1, 2], np.array([20, 30]), np.array([1, 0]), ["", "x"])
+    cube, n_duplicates = merge_cubes([2, 3], cube1, [[0], [0, 1]],
+                                     cube2, [[0], [1, 2]], keep="last")
+    assert n_duplicates == 1
+    assert cube.value_list() == [1, 20, 30, None, None, None]
+    assert cube.status_list() == ["", "x", "", "", "", ""]
+
+    cube, n_duplicates = merge_cubes([2, 3], cube1, [[0], [0, 1]],
+                                     cube2, [[0], [1, 2]], keep="first")
+    assert cube.value_list()[:3] == [1, 2, 30]
+    assert cube.status_list()[:3] == ["", "", ""]
+
+
+def test_resolve_duplicates():
+    flat = np.array([3, 1, 3, 1])
+    values = np.array([1, 2, 3, 4])
+    positions, _values, _ = resolve_duplicates(flat, values, how="last")
+    assert positions.tolist() == [1, 3]
+    assert _values.tolist() == [4, 3]
+
+    positions, _values, _ = resolve_duplicates(flat, values, how="sum")
+    assert _values.tolist() == [6, 4]
+    assert _values.dtype == np.int64
+
+
+def test_sparse_cube():
+    cube = Cube([2, 3], np.array([np.nan, 1, np.nan, np.nan, np.nan, 2]))
+    sparse = cube.to_sparse()
+    assert sparse.positions.tolist() == [1, 5]
+    assert sparse.value_dict() == {"1": 1.0, "5": 2.0}
+
+    transposed = sparse.transpose([1, 0])
+    assert transposed.value_list() == cube.transpose([1, 0]).value_list()
+
+    taken = sparse.take([None, [2, 1]])
+    assert taken.value_list() == [None, 1.0, 2.0, None]
+
+
+def test_set_null_on_read_only_values():
+    values = np.array([1.5, 2.5])
+    values.flags.writeable = False
+    cube = Cube([2], values)
+    cube.set_null(np.array([True, False]))
+    assert cube.value_list() == [None, 2.5]
+    assert values.tolist() == [1.5, 2.5]
+
+
+def test_flat_to_codes():
+    codes = flat_to_codes([2, 3], np.array([2, 3, 5]))
+    assert [x.tolist() for x in codes] == [[0, 1, 1], [2, 0, 2]]
+    assert codes_to_flat([2, 3], codes).tolist() == [2, 3, 5]
+
+
+def test_rollup_with_sparse_membership():
+    # 3 categories (rows) by 2 years
+    cube = Cube([3, 2], np.array([1, 2, np.nan, 4, 5, np.nan]))
+    # New category 0 has members 0 and 1, new category 1 has members 1 and 2
+    membership = (np.array([1, 0, 1, 0]), np.array([2, 1, 1, 0]))
+
+    result = rollup(cube, 0, membership)
+    assert list(result.size) == [5, 2]
+    assert result.value_list()[6:] == [1, 6, 5, 4]
+
+    result = rollup(cube, 0, membership, how="mean")
+    assert result.value_list()[6:] == [1, 3, 5, 4]
+
+    # No new categories
+    empty = (np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+    assert list(rollup(cube, 0, empty).size) == [3, 2]
@@ -4,11 +4,15 @@ import pytest
 from glob import glob
 from copy import deepcopy
 import json
+import gzip
 import pandas as pd
+import numpy as np
 
-from marple.dataset import Dataset, MalformedJSONStat, MergeFailure
+from marple.dataset import (Dataset, MalformedJSONStat, MergeFailure,
+    Dimension, get_schema_validator)
 from data.dataset.dataset_example_data import *
 from jsonschema.exceptions import ValidationError
+from marple.predicate import Dim, Status, Value
 
 # ==== INITIALIZATION TESTS ======
 
@@ -339,3 +343,798 @@ def test_to_json_with_round():
 
     two_dec = json.loads(ds.to_json(decimals=2))["value"]
     assert two_dec == [0.12, 0.99, None]
+
+def test_value_array():
+    ds = Dataset(deepcopy(complete_dataset))
+    values = ds.value_array
+    assert values.shape == (2, 2, 1)
+    assert values[1, 0, 0] == 3
+    with pytest.raises(ValueError):
+        values[0, 0, 0] = 10
+
+def test_value_and_status_list_from_dict():
+    json_data = deepcopy(complete_dataset)
+    json_data["value"] = { "0": 1, "3": 4 }
+    ds = Dataset(json_data)
+    assert ds.value_list == [1, None, None, 4]
+    assert ds.status_list == ["", "x", "", ""]
+
+def test_json_is_produced_on_demand():
+    ds = Dataset(deepcopy(complete_dataset))
+    cube = ds._get_cube().copy()
+    cube.values[0] = 10
+    ds._set_cube(cube)
+    assert "value" not in ds._json_data
+    assert ds.json["value"] == [10, 2, 3, 4]
+    assert ds.json["status"] == ["", "x", "", ""]
+
+def test_to_table_rows():
+    ds = Dataset(deepcopy(complete_dataset))
+    table = ds.to_table(content="id")
+    assert table[0] == ("region", "gender", "measure", "value", "status")
+    assert table[1] == ("Stockholm", "M", "share", 1, "")
+    assert table[2] == ("Stockholm", "F", "share", 2, "x")
+    assert table[4] == ("Solna", "F", "share", 4, "")
+
+def test_to_dataframe_with_custom_columns():
+    ds = Dataset(deepcopy(complete_dataset))
+    df = ds.to_dataframe(value_column="val", status_column="flag")
+    assert df.columns.tolist() == ["Region", u"Kön", "measure", "val", "flag"]
+    assert df["Region"].tolist() == ["Stockholm kommun"] * 2 + ["Solna kommun"] * 2
+    assert df["val"].tolist() == [1, 2, 3, 4]
+    assert df["flag"].tolist() == ["", "x", "", ""]
+
+def test_filter_by_query_values_and_metadata():
+    json_data = deepcopy(complete_dataset)
+    ds = Dataset(json_data)
+    ds.filter_by_query({"region": "Solna", "gender": ["F"]})
+    assert ds.json["size"] == [1, 1, 1]
+    assert ds.json["value"] == [4]
+    region = ds.dimension("region")
+    assert [cat.id for cat in region.categories] == ["Solna"]
+    assert region.category("Solna").note == ["My Solna note"]
+    assert region.labels == {"Solna": "Solna kommun"}
+    assert ds.dimension("measure").category("share").unit["label"] == "%"
+    # The original json data is untouched
+    assert json_data["value"] == [1, 2, 3, 4]
+
+    # Also when changing metadata afterwards, on filtered and unfiltered
+    # dimensions
+    ds.add_labels("measure", {"share": "Andel"})
+    ds.dimension("region").category("Solna").note.append("Another note")
+    ds.json["note"].append("Another dataset note")
+    assert json_data == complete_dataset
+
+def test_filter_by_query_with_labels():
+    ds = Dataset(deepcopy(complete_dataset))
+    ds.filter_by_query({"region": "Stockholm kommun"}, content="label")
+    assert ds.value_list == [1, 2]
+    assert ds.status_list == ["", "x"]
+
+def test_filter_by_query_on_missing_dimension():
+    ds = Dataset(deepcopy(complete_dataset))
+    with pytest.raises(KeyError):
+        ds.filter_by_query({"foo": "bar"})
+
+def test_append_does_not_change_original_json():
+    json_data = deepcopy(complete_dataset)
+    ds = Dataset(json_data)
+    ds.append(Dataset(deepcopy(dataset_to_append)))
+
+    ds.add_labels("gender", {"M": "Men"})
+    ds.add_labels("measure", {"share": "Andel"})
+    ds.dimension("region").category("Solna").note.append("Another note")
+    assert json_data == complete_dataset
+
+def test_append_with_other_dimension_order():
+    ds1 = Dataset().from_json(deepcopy(complete_dataset))
+    json_data = deepcopy(dataset_to_append)
+    # Same data as dataset_to_append, with gender as first dimension
+    json_data["id"] = ["gender", "region", "measure"]
+    json_data["size"] = [2, 1, 1]
+    json_data["status"] = ["", "y"]
+    ds2 = Dataset(json_data)
+    ds1.append(ds2)
+
+    assert ds1.json["id"] == ["region", "gender", "measure"]
+    assert ds1.json["size"] == [3, 2, 1]
+    assert ds1.value_list == [1, 2, 3, 4, 5, 6]
+    assert ds1.status_list == ["", "x", "", "", "", "y"]
+    assert ds1.dimension("region").category(u"Malmö").label == u"Malmö kommun"
+
+def test_append_completes_missing_cells():
+    ds1 = Dataset().from_json(deepcopy(complete_dataset))
+    json_data = deepcopy(dataset_to_append)
+    json_data["dimension"]["gender"]["category"]["index"] = ["M", "X"]
+    ds1.append(Dataset(json_data))
+
+    assert ds1.json["size"] == [3, 3, 1]
+    assert ds1.value_list == [1, 2, None, 3, 4, None, 5, None, 6]
+
+def test_validation_levels():
+    json_data = deepcopy(complete_dataset)
+    json_data["label"] = 1  # Not allowed by schema
+
+    with pytest.raises(ValidationError):
+        Dataset(deepcopy(json_data))
+
+    Dataset(deepcopy(json_data), validate="structural")
+
+    with pytest.raises(MalformedJSONStat):
+        Dataset(deepcopy(wrong_size_dataset), validate="structural")
+
+    Dataset(deepcopy(wrong_size_dataset), validate="none")
+
+    with pytest.raises(ValueError):
+        Dataset(deepcopy(complete_dataset), validate="foo")
+
+    with pytest.raises(TypeError):
+        Dataset(deepcopy(wrong_size_dataset), validation="none")
+
+def test_schema_validator_is_cached():
+    ds = Dataset(deepcopy(complete_dataset))
+    validator = get_schema_validator(ds._schema_path)
+    assert get_schema_validator(ds._schema_path) is validator
+
+def test_structural_validation_of_value_and_status():
+    json_data = deepcopy(complete_dataset)
+    json_data["value"] = { "0": 1, "4": 2 }
+    with pytest.raises(MalformedJSONStat):
+        Dataset(json_data, validate="structural")
+
+    json_data = deepcopy(complete_dataset)
+    json_data["status"] = ["a", "b"]
+    with pytest.raises(MalformedJSONStat):
+        Dataset(json_data)
+
+    # A single status applies to all values
+    json_data = deepcopy(complete_dataset)
+    json_data["status"] = ["a"]
+    assert Dataset(json_data).status_list == ["a", "a", "a", "a"]
+
+def test_structural_validation_does_not_create_dimensions(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("Dimension created during validation")
+
+    ds = Dataset(deepcopy(complete_dataset))
+    monkeypatch.setattr(Dimension, "__init__", fail)
+    ds._validate(ds._json_data, "structural")
+
+def test_category_lookup():
+    ds = Dataset(deepcopy(complete_dataset))
+    region = ds.dimension("region")
+    assert region.category("Solna").id == "Solna"
+    assert region.category("Solna kommun").id == "Solna"
+
+    # Lookups are updated when labels change
+    region.labels = {"Solna": "Solna stad"}
+    assert region.category("Solna stad").id == "Solna"
+    region.category("Solna").label = "Solna kommun"
+    assert region.category("Solna kommun").id == "Solna"
+    with pytest.raises(KeyError):
+        region.category("Solna stad")
+
+def test_category_lookup_with_colliding_labels():
+    ds = Dataset(deepcopy(complete_dataset))
+    region = ds.dimension("region")
+    # Label equals the id of another category: id wins
+    region.labels = {"Solna": "Stockholm"}
+    assert region.category("Stockholm").id == "Stockholm"
+
+    # Same label on two categories
+    region.labels = {"Solna": "Kommun", "Stockholm": "Kommun"}
+    with pytest.raises(KeyError):
+        region.category("Kommun")
+
+def test_dimensions_are_cached():
+    ds = Dataset(deepcopy(complete_dataset))
+    region = ds.dimension("region")
+    assert ds.dimension("region") is region
+    assert ds.dimensions[0] is region
+    assert region.categories is region.categories
+
+    # New dimensions when structure changes
+    ds.filter_by_query({"region": "Solna"})
+    assert ds.dimension("region") is not region
+    assert [cat.id for cat in ds.dimension("region").categories] == ["Solna"]
+    assert ds.dimension("gender") is ds.dimension("gender")
+
+def test_categories_are_rebuilt_when_index_is_replaced():
+    ds = Dataset(deepcopy(complete_dataset))
+    gender = ds.dimension("gender")
+    assert gender.category("M").pos == 0
+    gender.json["category"]["index"] = ["F", "M"]
+    assert [cat.id for cat in gender.categories] == ["F", "M"]
+    assert gender.category("M").pos == 1
+
+def test_metadata_is_preserved_after_filter_with_function():
+    ds = Dataset(deepcopy(complete_dataset))
+    ds.filter(lambda x: x["region"] == "Solna")
+    assert ds.value_list == [3, 4]
+    assert ds.note == ["My dataset note"]
+    assert ds.dimension("region").note == ["My region note"]
+    assert ds.dimension("region").category("Solna").note == ["My Solna note"]
+    assert ds.dimension("region").category("Solna").label == "Solna kommun"
+
+def test_meta_data_snapshot():
+    ds = Dataset(deepcopy(complete_dataset))
+    snapshot = ds._meta_data_snapshot()
+    assert snapshot["dataset"]["label"] == complete_dataset["label"]
+    dim_meta_data, cat_meta_data = snapshot["dimensions"]["region"]
+    assert dim_meta_data["note"] == ["My region note"]
+    assert cat_meta_data["Solna"]["note"] == ["My Solna note"]
+    assert "value" not in snapshot["dataset"]
+
+    # The snapshot is a copy
+    snapshot["dataset"]["note"].append("foo")
+    assert ds.note == ["My dataset note"]
+
+def test_from_sparse_dataframe():
+    df = pd.DataFrame([
+        ["Solna", "M", 1, "x"],
+        ["Stockholm", "F", 2, None],
+        ["Solna", "F", None, ""],
+    ], columns=["region", "gender", "value", "status"])
+    ds = Dataset(df)
+    assert ds.json["size"] == [2, 2]
+    assert ds.dimension("region").json["category"]["index"] == {"Solna": 0, "Stockholm": 1}
+    assert ds.dimension("gender").json["category"]["index"] == {"M": 0, "F": 1}
+    assert ds.json["value"] == [1, None, None, 2]
+    assert ds.json["status"] == ["x", "", "", ""]
+
+def test_from_dataframe_with_duplicates():
+    df = pd.DataFrame([
+        ["Solna", "M", 1],
+        ["Solna", "M", 2],
+    ], columns=["region", "gender", "value"])
+    with pytest.raises(MalformedJSONStat):
+        Dataset(df)
+
+def test_from_dataframe_with_integer_categories():
+    df = pd.DataFrame([[2016, 1], [2017, 2]], columns=["year", "value"])
+    ds = Dataset(df)
+    assert [cat.id for cat in ds.dimension("year").categories] == ["2016", "2017"]
+    assert ds.value_list == [1, 2]
+
+def test_from_dataframe_with_duplicate_policies():
+    df = pd.DataFrame([
+        ["Solna", 1, "a"],
+        ["Solna", 2, "b"],
+        ["Solna", None, "c"],
+        ["Stockholm", 5, ""],
+    ], columns=["region", "value", "status"])
+
+    ds = Dataset(df, on_duplicates="first")
+    assert ds.value_list == [1, 5]
+    assert ds.status_list == ["a", ""]
+
+    ds = Dataset(df, on_duplicates="last")
+    assert ds.value_list == [None, 5]
+    assert ds.status_list == ["c", ""]
+
+    ds = Dataset(df, on_duplicates="sum")
+    assert ds.value_list == [3, 5]
+    assert ds.status_list == ["a", ""]
+
+    assert Dataset(df, on_duplicates="mean").value_list == [1.5, 5]
+
+    with pytest.raises(ValueError):
+        Dataset(df, on_duplicates="foo")
+
+    with pytest.raises(TypeError):
+        Dataset(df, on_duplicate="first")
+
+def test_sparse_dataset():
+    ds = Dataset(deepcopy(sparse_dataset))
+    assert ds.is_sparse
+    assert ds.value_list[11] == 2
+    assert ds.status_list[55] == "y"
+
+    ds.filter_by_query({"region": ["1", "5", "9"]})
+    assert ds.is_sparse
+    assert ds.json["value"] == {"1": 2, "5": 4, "29": 3}
+    assert ds.json["status"] == {"1": "x", "15": "y"}
+
+    df = ds.to_dataframe(content="index")
+    assert len(df) == 30
+    assert df["value"].notnull().sum() == 3
+
+    # Written as list when most cells are populated
+    ds.filter_by_query({"region": "1", "year": "2001"})
+    assert ds.json["value"] == [2]
+
+def test_sparse_dataset_filter_by_predicate():
+    ds = Dataset(deepcopy(sparse_dataset))
+    ds.filter(Dim("region") == "1")
+    assert ds.is_sparse
+    assert ds.json["value"] == {"1": 2, "5": 4}
+
+    # Conditions on values are evaluated on stored cells only
+    ds = Dataset(deepcopy(sparse_dataset))
+    ds.filter((Value() > 1) & (Status() != "x"))
+    assert ds.is_sparse
+    assert [cat.id for cat in ds.dimension("region").categories] == ["1", "9"]
+    assert [cat.id for cat in ds.dimension("year").categories] == ["2005", "2009"]
+    assert ds.value_list == [4, None, None, 3]
+
+    # Empty cells match, so categories without values are kept
+    ds = Dataset(deepcopy(sparse_dataset))
+    ds.filter(Value().isnull())
+    assert ds.dimension("region").length == 10
+    assert ds.value_list.count(None) == 100
+
+
+def test_sparse_dataset_from_dataframe():
+    df = pd.DataFrame(sparse_table_data)
+    ds = Dataset(df)
+    assert ds.is_sparse
+    assert ds.length == 100
+    assert ds.json["value"]["11"] == 1
+
+    # Cells without value count as duplicates, as in a dense dataset
+    df2 = pd.DataFrame({"region": ["0"], "year": ["2009"], "value": [5]})
+    with pytest.raises(MergeFailure):
+        ds.append(Dataset(df2))
+
+    ds.append(Dataset(df2), on_duplicates="update")
+    assert ds.is_sparse
+    assert ds.value_list[9] == 5
+    assert ds.value_list[11] == 1
+    assert len(ds.json["value"]) == 11
+
+@pytest.mark.parametrize("on_duplicates", ["update", "preserve", "break"])
+def test_append_does_not_depend_on_storage(on_duplicates):
+    def make(values, sparse):
+        ds = Dataset(pd.DataFrame({
+            "region": ["a", "a", "b", "b"],
+            "year": ["2000", "2001", "2000", "2001"],
+            "value": values,
+        }))
+        cube = ds._get_cube()
+        ds._set_cube(cube.to_sparse() if sparse else cube.dense())
+        return ds
+
+    results = []
+    for sparse in [False, True]:
+        ds1 = make([1, 2, 3, None], sparse)
+        ds2 = make([None, None, None, 9], sparse)
+        # Only overlaps on cells without value in one of the datasets
+        ds2.filter_by_query({"region": "b"})
+        try:
+            ds1.append(ds2, on_duplicates=on_duplicates)
+            results.append((ds1.value_list, ds1.status_list))
+        except MergeFailure:
+            results.append(MergeFailure)
+
+    assert results[0] == results[1]
+    if on_duplicates == "update":
+        assert results[1][0] == [1, 2, None, 9]
+    elif on_duplicates == "preserve":
+        assert results[1][0] == [1, 2, 3, None]
+    else:
+        assert results[1] == MergeFailure
+
+def test_to_json():
+    df = pd.DataFrame([
+        ["Solna", 1.234, "x"],
+        ["Stockholm", None, ""],
+    ], columns=["region", "value", "status"])
+    ds = Dataset(df)
+
+    json_data = json.loads(ds.to_json(decimals=1))
+    assert json_data["value"] == [1.2, None]
+    assert json_data["status"] == ["x", ""]
+    assert json_data["size"] == [2]
+
+    compact = ds.to_json(indent=None)
+    assert "\n" not in compact
+    assert json.loads(compact)["value"] == [1.234, None]
+
+    # The dataset is left untouched
+    assert ds.value_list == [1.234, None]
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_to_json_format(monkeypatch, use_orjson):
+    import marple.utils
+    if not use_orjson:
+        monkeypatch.setattr(marple.utils, "orjson", None)
+
+    ds = Dataset({
+        "version": "2.0",
+        "class": "dataset",
+        "label": u"Befolkning i Malmö",
+        "id": ["region", "year"],
+        "size": [2, 2],
+        "dimension": {
+            "region": {"category": {"index": [u"Malmö", "Lund"]}},
+            "year": {"category": {"index": ["2017", "2018"]}},
+        },
+        "value": [1, 2, None, 4],
+        "status": {"3": ".."},
+    })
+    ds.filter_by_query({"region": "Lund"})
+    assert ds.to_json(indent=None) == (
+        u'{"class":"dataset","dimension":{'
+        u'"region":{"category":{"index":["Lund"]}},'
+        u'"year":{"category":{"index":["2017","2018"]}}},'
+        u'"id":["region","year"],"label":"Befolkning i Malmö",'
+        u'"size":[1,2],"status":["",".."],"value":[null,4.0],"version":"2.0"}')
+
+    # Integers are written as floats also without missing values
+    ds = Dataset(deepcopy(complete_dataset))
+    assert ds.value_array.dtype.kind == "i"
+    assert u'"value":[1.0,2.0,3.0,4.0]' in ds.to_json(indent=None)
+    assert ds.value_list == [1, 2, 3, 4]
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_to_json_with_non_string_keys(monkeypatch, use_orjson):
+    import marple.utils
+    if not use_orjson:
+        monkeypatch.setattr(marple.utils, "orjson", None)
+
+    ds = Dataset(deepcopy(complete_dataset))
+    outputs = [ds.to_json(indent=indent) for indent in (None, 2, 4)]
+    for output in outputs:
+        assert json.loads(output)["status"] == {"1": "x"}
+    assert json.loads(outputs[0]) == json.loads(outputs[2])
+
+def test_to_json_file(tmpdir):
+    df = pd.DataFrame([
+        ["Solna", 1.234, "x,y"],
+        ["Stockholm", None, ""],
+        ["Malmö", 3, ""],
+    ], columns=["region", "value", "status"])
+    ds = Dataset(df)
+
+    for indent in [None, 4]:
+        file_path = str(tmpdir.join("dataset.json"))
+        ds.to_json_file(file_path, indent=indent, chunk_size=2)
+        with open(file_path) as f:
+            assert json.load(f) == json.loads(ds.to_json())
+
+    file_path = str(tmpdir.join("dataset.json.gz"))
+    ds.to_json_file(file_path, decimals=1)
+    with gzip.open(file_path) as f:
+        json_data = json.loads(f.read().decode("utf-8"))
+    assert json_data["value"] == [1.2, None, 3.0]
+    assert json_data["status"] == ["x,y", "", ""]
+
+def test_binary(tmpdir):
+    file_path = str(tmpdir.join("dataset.bin"))
+    for json_file in glob("tests/data/dataset/dataset_*.json"):
+        ds = Dataset(json_file)
+        value_list, status_list = ds.value_list, ds.status_list
+        ds.to_binary(file_path)
+
+        ds2 = Dataset().from_binary(file_path)
+        assert ds2.value_list == value_list
+        assert ds2.status_list == status_list
+        assert ds2.label == ds.label
+        assert ds2.note == ds.note
+        assert ds2.extension == ds.extension
+        for dim in ds.dimensions:
+            dim2 = ds2.dimension(dim.id)
+            assert dim2.labels == dim.labels
+            assert dim2.notes == dim.notes
+            assert dim2.units == dim.units
+
+    # Sparse datasets and string values
+    df = pd.DataFrame(dict(sparse_table_data,
+                           value=["a", None] + list(range(8))))
+    ds = Dataset(df)
+    ds.to_binary(file_path)
+    ds2 = Dataset().from_binary(file_path)
+    assert ds2.is_sparse
+    assert ds2.value_list == ds.value_list
+
+    with pytest.raises(ValueError):
+        Dataset().from_binary(glob("tests/data/dataset/dataset_*.json")[0])
+
+def test_binary_mmap(tmpdir):
+    file_path = str(tmpdir.join("dataset.bin"))
+    ds = Dataset(pd.DataFrame([
+        ["Solna", "M", 1.5],
+        ["Solna", "F", 2.5],
+        ["Stockholm", "M", 3.5],
+        ["Stockholm", "F", 4.5],
+    ], columns=["region", "gender", "value"]))
+    ds.to_binary(file_path)
+
+    ds = Dataset().from_binary(file_path, mmap=True)
+    assert isinstance(ds._get_cube().values, np.memmap)
+    assert not ds.value_array.flags.writeable
+    assert ds.value_list == [1.5, 2.5, 3.5, 4.5]
+
+    ds.filter(Value() > 2)
+    assert ds.value_list == [None, 2.5, 3.5, 4.5]
+
+    # The file is untouched
+    assert Dataset().from_binary(file_path).value_list == [1.5, 2.5, 3.5, 4.5]
+
+def test_binary_mmap_write_to_same_file(tmpdir):
+    file_path = str(tmpdir.join("dataset.bin"))
+    df = pd.DataFrame({
+        "region": [str(x) for x in range(100)] * 250,
+        "year": [str(x) for x in range(250) for _ in range(100)],
+        "value": np.arange(25000, dtype=float),
+    })
+    Dataset(df).to_binary(file_path)
+
+    ds = Dataset().from_binary(file_path, mmap=True)
+    ds.to_binary(file_path)
+    # The mapped values are not affected
+    assert ds.value_list[-1] == 24999
+
+    ds2 = Dataset().from_binary(file_path)
+    assert ds2.value_list == ds.value_list
+    assert tmpdir.listdir() == [tmpdir.join("dataset.bin")]
+
+def test_iter_rows():
+    ds = Dataset(pd.DataFrame([
+        ["Solna", "M", 1, "x"],
+        ["Solna", "F", None, ""],
+        ["Stockholm", "M", 3, ""],
+        ["Stockholm", "F", 4, ""],
+    ], columns=["region", "gender", "value", "status"]))
+
+    rows = list(ds.iter_rows(content="id", chunk_size=3))
+    assert rows == ds.to_table(content="id")[1:]
+
+    rows = list(ds.iter_rows(content="id", include_status=False, skip_null=True))
+    assert rows == [
+        ("Solna", "M", 1),
+        ("Stockholm", "M", 3),
+        ("Stockholm", "F", 4),
+    ]
+
+    dfs = list(ds.iter_dataframes(chunk_size=3))
+    assert [len(df) for df in dfs] == [3, 1]
+    df = pd.concat(dfs, ignore_index=True)
+    assert df.equals(ds.to_dataframe())
+
+
+def test_iter_rows_of_sparse_dataset():
+    ds = Dataset(pd.DataFrame(sparse_table_data))
+    assert ds.is_sparse
+
+    rows = list(ds.iter_rows(content="id", skip_null=True, chunk_size=4))
+    assert rows[1] == ("1", "2001", 1, "")
+    assert len(rows) == 10
+
+    rows = list(ds.iter_rows(content="id", chunk_size=7))
+    assert rows == ds.to_table(content="id")[1:]
+
+def test_get():
+    ds = Dataset(pd.DataFrame([
+        ["Solna", "M", "2017", 1],
+        ["Solna", "F", "2017", None],
+        ["Stockholm", "M", "2017", 3],
+        ["Stockholm", "F", "2017", 4],
+    ], columns=["region", "gender", "year", "value"]))
+    ds.add_labels("gender", {"M": "Male", "F": "Female"})
+
+    assert ds.get(region="Stockholm", gender="F", year="2017") == 4
+    assert ds.get(region="Stockholm", gender="Female") == 4
+    assert ds.get(region="Solna", gender="F") is None
+
+    with pytest.raises(KeyError):
+        ds.get(region="Stockholm")
+
+    with pytest.raises(KeyError):
+        ds.get(region="Malmö", gender="F")
+
+    with pytest.raises(KeyError):
+        ds.get(region="Solna", gender="F", foo="bar")
+
+    coords = pd.DataFrame({
+        "region": ["Stockholm", "Solna", "Solna"],
+        "gender": ["Female", "M", "F"],
+    }, index=["a", "b", "c"])
+    values = ds.get_many(coords)
+    assert values["a"] == 4
+    assert values["b"] == 1
+    assert np.isnan(values["c"])
+
+    with pytest.raises(KeyError):
+        ds.get_many(pd.DataFrame({"region": ["Malmö"], "gender": ["F"]}))
+
+
+def test_get_from_sparse_dataset():
+    ds = Dataset(pd.DataFrame(sparse_table_data))
+    assert ds.get(region="3", year="2003") == 3
+    assert ds.get(region="3", year="2004") is None
+
+    values = ds.get_many(pd.DataFrame({
+        "region": ["3", "3"], "year": ["2003", "2004"]}))
+    assert values[0] == 3
+    assert np.isnan(values[1])
+
+def test_aggregate():
+    ds = Dataset(pd.DataFrame([
+        ["Solna", "M", 1, "x"],
+        ["Solna", "F", None, ""],
+        ["Stockholm", "M", 3, ""],
+        ["Stockholm", "F", 4, ""],
+    ], columns=["region", "gender", "value", "status"]))
+    ds.add_labels("gender", {"M": "Male", "F": "Female"})
+    ds.label = "Population"
+
+    total = ds.aggregate(over="region")
+    assert total.dimensions[0].id == "gender"
+    assert total.value_list == [4, 4]
+    assert total.status_list == ["", ""]
+    assert total.label == "Population"
+    assert total.dimension("gender").category("M").label == "Male"
+
+    assert ds.aggregate(over=["gender"], how="mean").value_list == [1, 3.5]
+    assert ds.aggregate(over=["gender"], how="min").value_list == [1, 3]
+    assert ds.aggregate(over=["gender"], how="max").value_list == [1, 4]
+    assert ds.aggregate(over=["gender"], how="count").value_list == [1, 2]
+
+    # The original dataset is untouched
+    total.dimension("gender").labels = {"M": "Men"}
+    assert ds.dimension("gender").category("M").label == "Male"
+    assert ds.length == 4
+
+    with pytest.raises(ValueError):
+        ds.aggregate(over=["region", "gender"])
+
+    with pytest.raises(KeyError):
+        ds.aggregate(over=["foo"])
+
+
+def test_aggregate_sparse_dataset():
+    ds = Dataset(pd.DataFrame({
+        "region": [str(x) for x in range(10)],
+        "year": [str(2000 + x % 5) for x in range(10)],
+        "measure": ["a"] * 10,
+        "value": range(10),
+    }))
+    ds.filter_by_query({"region": ["0", "1", "2", "3", "4", "5", "6", "7", "8"]})
+    assert ds.is_sparse
+    total = ds.aggregate(over=["region"])
+    assert total.value_list == [0 + 5, 1 + 6, 2 + 7, 3 + 8, 4]
+    assert ds.aggregate(over=["region"], how="count").value_list == [2, 2, 2, 2, 1]
+    assert ds.aggregate(over=["region"], how="max").value_list == [5, 6, 7, 8, 4]
+
+def test_rollup():
+    from marple.datatypes import Datatype, Domain
+    regions = Domain("regions/*", datatypes_dir="tests/data/datatypes")
+    ds = Dataset(pd.DataFrame([
+        [u"Upplands Väsby kommun", "2017", 1, "x"],
+        [u"Vallentuna kommun", "2017", 2, ""],
+        [u"Upplands Väsby kommun", "2018", 3, ""],
+        [u"Vallentuna kommun", "2018", None, ""],
+        [u"Blekinge län", "2017", 10, ""],
+        [u"Blekinge län", "2018", 20, ""],
+    ], columns=["region", "year", "value", "status"]))
+
+    ds2 = ds.rollup("region", regions)
+    region = ds2.dimension("region")
+    assert [cat.id for cat in region.categories][3:] == [u"Stockholms län", "Sweden"]
+    assert region.category("Sweden").label == "Sverige"
+    assert ds2.get(region=u"Stockholms län", year="2017") == 3
+    assert ds2.get(region=u"Stockholms län", year="2018") == 3
+    assert ds2.get(region="Sweden", year="2017") == 13
+    assert ds2.get(region=u"Vallentuna kommun", year="2018") is None
+    assert ds2.status_list[0] == "x"
+
+    ds3 = ds.rollup("region", regions, how="mean")
+    assert ds3.get(region=u"Stockholms län", year="2017") == 1.5
+
+    # The original dataset is untouched
+    assert ds.length == 6
+
+    # A datatype without domain
+    date = Datatype("date", datatypes_dir="tests/data/datatypes")
+    with pytest.raises(ValueError) as e:
+        ds.rollup("region", date)
+    assert "no domain" in str(e.value)
+
+def test_transpose():
+    ds = Dataset(pd.DataFrame([
+        ["2017", "Solna", 1, "x"],
+        ["2017", "Stockholm", 2, ""],
+        ["2018", "Solna", 3, ""],
+        ["2018", "Stockholm", 4, ""],
+    ], columns=["year", "region", "value", "status"]))
+    ds.add_labels("region", {"Solna": "Solna kommun"})
+    table = set((region, year, value, status) for year, region, value, status
+                in ds.to_table(content="id")[1:])
+
+    ds.transpose(["region", "year"])
+    assert ds.json["id"] == ["region", "year"]
+    assert ds.value_list == [1, 3, 2, 4]
+    assert ds.status_list == ["x", "", "", ""]
+    assert set(ds.to_table(content="id")[1:]) == table
+    assert ds.dimension("region").category("Solna").label == "Solna kommun"
+
+    with pytest.raises(ValueError):
+        ds.transpose(["region"])
+
+def test_sort_categories():
+    from marple.datatypes import Datatype, Domain
+    ds = Dataset(pd.DataFrame([
+        [u"Vallentuna kommun", "2017", 2, "x"],
+        [u"Vallentuna kommun", "2018", 1, ""],
+        [u"Upplands Väsby kommun", "2017", 3, ""],
+        [u"Upplands Väsby kommun", "2018", None, ""],
+        [u"Österåkers kommun", "2017", 1, ""],
+        [u"Österåkers kommun", "2018", 5, ""],
+    ], columns=["region", "year", "value", "status"]))
+    ds.add_labels("region", {u"Vallentuna kommun": "B", u"Upplands Väsby kommun": "A",
+                             u"Österåkers kommun": "C"})
+
+    def region_ids():
+        return [cat.id for cat in ds.dimension("region").categories]
+
+    ds.sort_categories("region", key=lambda cat: cat.label)
+    assert region_ids() == [u"Upplands Väsby kommun", u"Vallentuna kommun",
+                            u"Österåkers kommun"]
+    assert ds.value_list == [3, None, 2, 1, 1, 5]
+    assert ds.status_list[2] == "x"
+    assert ds.dimension("region").category(u"Vallentuna kommun").label == "B"
+
+    ds.sort_categories("region", order=[u"Österåkers kommun"])
+    assert region_ids()[0] == u"Österåkers kommun"
+
+    regions = Domain("regions/*", datatypes_dir="tests/data/datatypes")
+    ds.sort_categories("region", order=regions)
+    assert region_ids() == [u"Upplands Väsby kommun", u"Vallentuna kommun",
+                            u"Österåkers kommun"]
+
+    ds.sort_categories("region", by={"year": "2018"}, ascending=False)
+    assert region_ids() == [u"Österåkers kommun", u"Vallentuna kommun",
+                            u"Upplands Väsby kommun"]
+    assert ds.get(region=u"Vallentuna kommun", year="2017") == 2
+
+    with pytest.raises(ValueError):
+        ds.sort_categories("region")
+
+    # A datatype without domain
+    date = Datatype("date", datatypes_dir="tests/data/datatypes")
+    with pytest.raises(ValueError) as e:
+        ds.sort_categories("region", order=date)
+    assert "no domain" in str(e.value)
+
+def test_diff_and_pct_change():
+    ds = Dataset(pd.DataFrame([
+        ["Solna", "2015-01", 10],
+        ["Solna", "2015-02", 12],
+        ["Solna", "2016-01", 15],
+        ["Solna", "2016-02", 6],
+        ["Nacka", "2015-01", 0],
+        ["Nacka", "2015-02", None],
+        ["Nacka", "2016-01", 4],
+        ["Nacka", "2016-02", 5],
+    ], columns=["region", "month", "value"]))
+
+    diff = ds.diff("month", periods=12)
+    assert diff.get(region="Solna", month="2016-01") == 5
+    assert diff.get(region="Solna", month="2016-02") == -6
+    assert diff.get(region="Nacka", month="2016-01") == 4
+    assert diff.get(region="Nacka", month="2016-02") is None
+    assert diff.get(region="Solna", month="2015-01") is None
+    assert diff.dimension("month").categories[0].id == "2015-01"
+    # The original dataset is unchanged
+    assert ds.get(region="Solna", month="2016-01") == 15
+
+    pct = ds.pct_change("month", periods=12)
+    assert pct.get(region="Solna", month="2016-01") == 0.5
+    assert pct.get(region="Solna", month="2016-02") == -0.5
+    # Change from 0
+    assert pct.get(region="Nacka", month="2016-01") is None
+
+    # Previous month, with a gap between 2015-02 and 2016-01
+    diff = ds.diff("month")
+    assert diff.get(region="Solna", month="2015-02") == 2
+    assert diff.get(region="Solna", month="2016-01") is None
+
+    ds = Dataset(pd.DataFrame([
+        ["2015Q4", 4],
+        ["2016Q1", 5],
+    ], columns=["quarter", "value"]))
+    assert ds.diff("quarter").value_list == [None, 1]
+
+    with pytest.raises(KeyError):
+        ds.diff("month")
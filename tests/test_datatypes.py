@@ -74,3 +74,11 @@ def test_labels_in_multiple_languages():
 
     assert gender_en.label == "Gender"
     assert gender_sv.label == u"Kön"
+
+def test_parents():
+    x = Domain("regions/*", datatypes_dir=DATATYPES_DIR)
+    parents = x.parents()
+    assert parents[u"Stockholms län"] == "Sweden"
+    assert "Sweden" not in parents
+
+    assert Domain("misc/age_groups", datatypes_dir=DATATYPES_DIR).parents() == {}
@@ -0,0 +1,83 @@
+# encoding: utf-8
+
+import pytest
+from copy import deepcopy
+
+from marple.dataset import Dataset
+from marple.predicate import Dim, Value, Status
+from data.dataset.dataset_example_data import complete_dataset
+
+
+def _dataset():
+    return Dataset(deepcopy(complete_dataset))
+
+
+def test_dimension_equality():
+    ds = _dataset().filter(Dim("gender") == "F")
+    assert ds.json["size"] == [2, 1, 1]
+    assert ds.value_list == [2, 4]
+    assert ds.status_list == ["x", ""]
+
+
+def test_dimension_negation_and_or():
+    ds = _dataset().filter(~(Dim("gender") == "F") & (Dim("region") == "Solna"))
+    assert ds.value_list == [3]
+
+    ds = _dataset().filter((Dim("gender") == "F") | (Dim("gender") == "M"))
+    assert ds.value_list == [1, 2, 3, 4]
+
+
+def test_or_across_dimensions_sets_null():
+    ds = _dataset().filter((Dim("gender") == "F") | (Dim("region") == "Solna"))
+    assert ds.json["size"] == [2, 2, 1]
+    assert ds.value_list == [None, 2, 3, 4]
+
+
+def test_filter_on_labels():
+    ds = _dataset().filter(Dim("region").isin(["Solna kommun"]), content="label")
+    assert ds.value_list == [3, 4]
+
+
+def test_value_conditions():
+    ds = _dataset().filter(Value() > 2)
+    assert [cat.id for cat in ds.dimension("region").categories] == ["Solna"]
+    assert ds.value_list == [3, 4]
+
+    ds = _dataset().filter((Dim("region") == "Stockholm") & (Value() != 1))
+    assert ds.value_list == [2]
+
+
+def test_status_conditions():
+    ds = _dataset().filter(Status() != "")
+    assert ds.value_list == [2]
+    assert ds.status_list == ["x"]
+
+
+def test_time_ranges():
+    json_data = {
+        "id": ["month"],
+        "size": [4],
+        "value": [1, 2, 3, 4],
+        "dimension": {
+            "month": {
+                "category": {
+                    "index": ["2015-11", "2015-12", "2016-01", "2016-02"]
+                }
+            }
+        }
+    }
+    ds = Dataset(deepcopy(json_data)).filter(Dim("month").between("2015-12", "2016-01"))
+    assert ds.value_list == [2, 3]
+
+    ds = Dataset(deepcopy(json_data)).filter(Dim("month") >= 2016)
+    assert ds.value_list == [3, 4]
+
+
+def test_predicates_are_not_booleans():
+    with pytest.raises(TypeError):
+        (Dim("gender") == "F") and (Dim("region") == "Solna")
+
+
+def test_unknown_dimension():
+    with pytest.raises(KeyError):
+        _dataset().filter(Dim("foo") == "bar")
@@ -0,0 +1,56 @@
+# encoding: utf-8
+
+import json
+import numpy as np
+
+from marple.reader import read_json_stat, find_value, parse_numbers
+
+
+def test_find_value():
+    data = b'{"dimension": {"value": {"category": {}}}, "status": ["[", "]"], "value": [1, 2]}'
+    start, end = find_value(data)
+    assert data[start:end] == b"[1, 2]"
+
+    assert find_value(b'{"value": {"0": 1}}') is None
+
+
+def test_parse_numbers():
+    data = b"[1, 2,\n 3]"
+    values = parse_numbers(data, 1, len(data) - 1, chunk_size=2)
+    assert values.dtype == np.int64
+    assert values.tolist() == [1, 2, 3]
+
+    data = b"[1.5, null, 3, -1e2]"
+    values = parse_numbers(data, 1, len(data) - 1, chunk_size=4)
+    assert np.isnan(values[1])
+    assert values[[0, 2, 3]].tolist() == [1.5, 3, -100]
+
+    data = b'[1, "a"]'
+    assert parse_numbers(data, 1, len(data) - 1) is None
+
+    assert parse_numbers(b"[ ]", 1, 2).tolist() == []
+
+
+def test_read_json_stat(tmpdir):
+    json_data = {
+        "id": ["a"],
+        "size": [3],
+        "dimension": {"a": {"category": {"index": ["x", "y", "z"]}}},
+        "value": [1.5, None, 3],
+        "status": ["", "..", ""],
+    }
+    file_path = str(tmpdir.join("dataset.json"))
+    with open(file_path, "w") as f:
+        json.dump(json_data, f)
+
+    _json_data, values = read_json_stat(file_path, chunk_size=3)
+    assert _json_data["value"] == []
+    assert _json_data["status"] == json_data["status"]
+    assert values[[0, 2]].tolist() == [1.5, 3]
+    assert np.isnan(values[1])
+
+    json_data["value"] = ["a", "b", "c"]
+    with open(file_path, "w") as f:
+        json.dump(json_data, f)
+
+    assert read_json_stat(file_path) == (json_data, None)
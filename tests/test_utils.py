@@ -1,6 +1,7 @@
 # encoding: utf-8
 from marple.utils import (list_files, guess_periodicity, to_timepoint,
-    subtract_periods, parse_lingual_object, get_decimal_encoder, parse_decimal)
+    subtract_periods, parse_lingual_object, get_decimal_encoder, parse_decimal,
+    dumps_json)
 import pytest
 import json
 import numpy as np
@@ -43,6 +44,10 @@ def test_subtract_periods():
     assert subtract_periods(2015, 2, "yearly") == "2013-01-01"
     assert subtract_periods("2015-03", 2, "monthly") == "2015-01-01"
     assert subtract_periods("2015-07-01", 6, "monthly") == "2015-01-01"
+    assert subtract_periods("2015Q3", 3, "quarterly") == "2014-10-01"
+
+    with pytest.raises(NotImplementedError):
+        subtract_periods("2015-07-01", 1, "weekly")
 
 def test_parse_lingual_object():
     obj = {
@@ -75,3 +80,26 @@ def test_decimal_encoder():
     assert(json.dumps(data, cls=get_decimal_encoder(1)) == '{"value": 1.5}')
     assert(json.dumps(data, cls=get_decimal_encoder(2)) == '{"value": 1.55}')
     assert(json.dumps(data, cls=get_decimal_encoder(3)) == '{"value": 1.546}')
+
+def test_dumps_json(monkeypatch):
+    import marple.utils
+    data = {"b": [1, None], "a": u"Malmö"}
+    assert dumps_json(data, sort_keys=True) == u'{"a":"Malmö","b":[1,null]}'
+
+    monkeypatch.setattr(marple.utils, "orjson", None)
+    assert dumps_json(data, sort_keys=True) == u'{"a":"Malmö","b":[1,null]}'
+    assert json.loads(dumps_json(data, indent=4)) == data
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_json_output_does_not_depend_on_backend(monkeypatch, use_orjson):
+    import marple.utils
+    if not use_orjson:
+        monkeypatch.setattr(marple.utils, "orjson", None)
+
+    data = {"value": [1e16, 1e-05, 0.5, float("nan"), float("inf"), 2 ** 70],
+            "status": {1: "x", 10: "y", 2: "z"}}
+    assert dumps_json(data) == (u'{"value":[1e+16,1e-05,0.5,null,null,'
+        u'1180591620717411303424],"status":{"1":"x","10":"y","2":"z"}}')
+    assert dumps_json(data, sort_keys=True).startswith(
+        u'{"status":{"1":"x","2":"z","10":"y"},')
+    assert json.loads(dumps_json(data, indent=2))["status"]["10"] == "y"